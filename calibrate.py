@@ -0,0 +1,250 @@
+import argparse
+import itertools
+import json
+import math
+import statistics
+import sys
+from array import array
+from pathlib import Path
+
+from legstats import load_reports
+
+# Odometer direction for each OdometerMode name
+MODE_SIGNS = {"PARK": 0, "DRIVE": 1, "REVERSE": -1}
+
+
+class FixLogWriter:
+    """Appends the fixes the odometer takes, and odometer commands, to a file.
+
+    Fixes are gpsd-style TPV lines and commands are MARK lines, in the
+    order they happened, so the odometer can be replayed from the log.
+    """
+
+    def __init__(self, filename: str):
+        self.file = open(filename, "a", buffering=1)
+
+    def fix(self, fix):
+        record = {
+            "class": "TPV",
+            "time": fix.timestamp.isoformat(),
+            "lat": fix.lat,
+            "lon": fix.lon,
+            "alt": fix.alt,
+        }
+        self.file.write(json.dumps(record) + "\n")
+
+    def mark(self, event: str, **values):
+        self.file.write(json.dumps(dict(values, **{"class": "MARK", "event": event})))
+        self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+
+class FixLog:
+    """A fix log loaded into columns, with the odometer's sign at every step"""
+
+    def __init__(self):
+        self.times = []
+        self.lat = array("d")
+        self.lon = array("d")
+        self.alt = array("d")
+        self.signs = array("b")  # for the step that ends at each fix
+        self.marks = []  # (number of fixes before it, MARK record)
+
+
+def load_fix_log(filename: str) -> FixLog:
+    log = FixLog()
+    sign = 0  # the odometer starts in Park
+    for line in Path(filename).read_text().splitlines():
+        record = json.loads(line)
+        if record["class"] == "TPV":
+            log.times.append(record["time"])
+            log.lat.append(record["lat"])
+            log.lon.append(record["lon"])
+            log.alt.append(record["alt"])
+            log.signs.append(sign)
+        elif record["class"] == "MARK":
+            log.marks.append((len(log.times), record))
+            if record["event"] == "mode":
+                sign = MODE_SIGNS[record["mode"]]
+    return log
+
+
+def step_distance(lat1, lon1, alt1, lat2, lon2, alt2) -> float:
+    """FourDPosition.subtract's distance, on plain numbers"""
+    rad = math.pi / 180
+    dLat = (lat2 - lat1) * rad
+    dLon = (lon2 - lon1) * rad
+    a = math.sin(dLat / 2) * math.sin(dLat / 2) + math.cos(lat1 * rad) * math.cos(
+        lat2 * rad
+    ) * math.sin(dLon / 2) * math.sin(dLon / 2)
+    horiz = 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)) * 1000
+    return math.sqrt(horiz**2 + (alt2 - alt1) ** 2)
+
+
+def step_distances(lat: array, lon: array, alt: array) -> array:
+    """Meters between consecutive fixes, in one pass over the columns.
+
+    Element 0 is 0, so element i is the step that ends at fix i.
+    """
+    steps = array("d", [0.0])
+    steps.extend(map(step_distance, lat, lon, alt, lat[1:], lon[1:], alt[1:]))
+    return steps
+
+
+def raw_odometer(log: FixLog) -> array:
+    """The uncalibrated odometer after each fix, had it never been zeroed"""
+    steps = step_distances(log.lat, log.lon, log.alt)
+    return array("d", itertools.accumulate(map(float.__mul__, steps, log.signs)))
+
+
+class CheckSegment:
+    """An odometer check: from a zero to the calibration entered after it"""
+
+    def __init__(self, start: str, end: str, raw: float, expected: float):
+        self.start = start
+        self.end = end
+        self.raw = raw  # meters
+        self.expected = expected  # meters
+        self.rejected = False
+
+    def calibration(self) -> float:
+        return self.expected / self.raw
+
+
+def find_segments(log: FixLog) -> list:
+    """Every zero followed by a calibration; a later calibration replaces one.
+
+    Undone zeros and calibrations (unzero and uncalibrate marks) are
+    taken back, most recent first.
+    """
+    odometer = raw_odometer(log)
+    segments = {}
+    zeros = []  # the odometer counts from the last fix before the last zero
+    calibrations = []  # (zero, the segment it replaced)
+    for fixes_before, mark in log.marks:
+        event = mark["event"]
+        if event == "zero":
+            zeros.append(max(fixes_before - 1, 0))
+        elif event == "unzero" and zeros:
+            zeros.pop()
+        elif event == "calibrate" and not (zeros and fixes_before):
+            calibrations.append((None, None))  # nothing to calibrate against
+        elif event == "calibrate":
+            zero = zeros[-1]
+            end = fixes_before - 1
+            calibrations.append((zero, segments.get(zero)))
+            raw = odometer[end] - odometer[zero]
+            if raw > 0:
+                segments[zero] = CheckSegment(
+                    log.times[zero], log.times[end], raw, mark["expected_m"]
+                )
+        elif event == "uncalibrate" and calibrations:
+            zero, replaced = calibrations.pop()
+            if zero is None:
+                continue
+            if replaced is None:
+                segments.pop(zero, None)
+            else:
+                segments[zero] = replaced
+    return list(segments.values())
+
+
+def fit_calibration(segments: list, threshold: float = 3, floor: float = 0.002):
+    """Least squares calibration across the checks, rejecting outliers.
+
+    Fits expected = calibration * raw, which weighs long checks more. Checks
+    whose relative residual is more than threshold robust standard
+    deviations (but at least floor) from the median are rejected, and the
+    fit is repeated until nothing more is rejected.
+    """
+    if not segments:
+        raise ValueError("No odometer checks in the log")
+    for segment in segments:
+        segment.rejected = False
+    while True:
+        used = [segment for segment in segments if not segment.rejected]
+        calibration = sum(s.raw * s.expected for s in used) / sum(
+            s.raw**2 for s in used
+        )
+        residuals = [(calibration * s.raw - s.expected) / s.expected for s in used]
+        median = statistics.median(residuals)
+        spread = 1.4826 * statistics.median(abs(r - median) for r in residuals)
+        limit = max(threshold * spread, floor)
+        outliers = [
+            segment
+            for segment, residual in zip(used, residuals)
+            if abs(residual - median) > limit
+        ]
+        if not outliers or len(outliers) == len(used):
+            return calibration
+        for segment in outliers:
+            segment.rejected = True
+
+
+def offset_changes(reports: list, calibration: float) -> list:
+    """How each logged leg's final pace offset would move under calibration.
+
+    A leg's distance scales with the calibration, so its offset moves by the
+    extra distance at the leg's CAST. Legs are not re-driven.
+    """
+    changes = []
+    for report in reports:
+        distance = report["distance_m"]
+        driven = distance.get("DRIVE", 0) - distance.get("REVERSE", 0)
+        extra = driven * (calibration / report["calibration"] - 1)
+        if report["cast_kmh"]:
+            seconds = extra / 1000 / report["cast_kmh"] * 3600
+        else:
+            seconds = 0.0
+        changes.append((report["instruction"], seconds))
+    return changes
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Fit the odometer calibration to every check in a fix log"
+    )
+    parser.add_argument("log", nargs="?", help="fix log, default from config.yaml")
+    parser.add_argument("--legs", help="leg log, default from config.yaml")
+    parser.add_argument("--apply", action="store_true", help="save it to config.yaml")
+    args = parser.parse_args(argv)
+
+    from rallycomp import Config  # rallycomp imports this module
+
+    config = Config("config.yaml")
+    filename = args.log or config.get_fix_log()
+    if not filename:
+        parser.error("give a fix log, or set fix_log in config.yaml")
+    segments = find_segments(load_fix_log(filename))
+    calibration = fit_calibration(segments)
+    unit = config.get_unit_name()
+    for segment in segments:
+        print(
+            "{} - {}  raw {:.3f} {}  expected {:.3f} {}  {:.5f}{}".format(
+                segment.start,
+                segment.end,
+                config.to_display_units(segment.raw / 1000),
+                unit,
+                config.to_display_units(segment.expected / 1000),
+                unit,
+                segment.calibration(),
+                "  rejected" if segment.rejected else "",
+            )
+        )
+    print(
+        "Calibration {:.5f} (now {:.5f})".format(
+            calibration, config.get_odometer_calibration()
+        )
+    )
+    legs = args.legs or config.get_leg_log()
+    if legs and Path(legs).exists():
+        for instruction, seconds in offset_changes(load_reports(legs), calibration):
+            print("Instruction {:4d}: offset {:+.2f} s".format(instruction, seconds))
+    if args.apply:
+        config.set_calibration(calibration)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from calibrate import (
+    CheckSegment,
+    FixLogWriter,
+    find_segments,
+    fit_calibration,
+    load_fix_log,
+    offset_changes,
+)
+from rallycomp import OdometerMode, RallyComputer
+from simulate import SyntheticSource, SyntheticTrack
+
+
+class TestCalibrate(unittest.TestCase):
+    def test_replay_matches_odometer(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "fixes.log")
+        track = SyntheticTrack(
+            datetime(2020, 1, 1, tzinfo=timezone.utc), drive_seconds=20, stop_seconds=5
+        )
+        rcomp = RallyComputer(SyntheticSource(track))
+        rcomp.fix_log = FixLogWriter(path)
+        rcomp.fix_log.fix(rcomp.odo.lastFix)
+        rcomp.config.set_calibration = lambda calibration: None  # keep config.yaml
+        raw = []
+        for expected in (0.3, 0.5):
+            rcomp.handle_command(("zero",))
+            rcomp.handle_command(("mode", OdometerMode.DRIVE))
+            for _ in range(30):
+                rcomp.receive_update()
+            rcomp.handle_command(("mode", OdometerMode.PARK))
+            rcomp.receive_update()
+            raw.append(rcomp.odo.distanceAccumulator)
+            rcomp.handle_command(("calibrate", expected))
+        log = rcomp.fix_log
+        rcomp.close()
+        self.assertTrue(log.file.closed)
+        segments = find_segments(load_fix_log(path))
+        self.assertEqual(len(segments), 2)
+        for segment, distance in zip(segments, raw):
+            self.assertAlmostEqual(segment.raw, distance, 6)
+        self.assertEqual([segment.expected for segment in segments], [300, 500])
+
+    def test_fit_rejects_outlier(self):
+        segments = [
+            CheckSegment("", "", raw, expected)
+            for raw, expected in [
+                (1000, 1010),
+                (2000, 2021),
+                (3000, 3029),
+                (1500, 1600),
+            ]
+        ]
+        calibration = fit_calibration(segments)
+        self.assertAlmostEqual(calibration, 1.01, 3)
+        self.assertEqual([s.rejected for s in segments], [False, False, False, True])
+
+    def test_offset_changes(self):
+        report = {
+            "instruction": 4,
+            "cast_kmh": 36,
+            "calibration": 1.0,
+            "distance_m": {"DRIVE": 1000, "PARK": 50},
+        }
+        [(instruction, seconds)] = offset_changes([report], 1.01)
+        self.assertEqual(instruction, 4)
+        self.assertAlmostEqual(seconds, 1.0)
+
+    def test_undone_commands_are_taken_back(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "fixes.log")
+        track = SyntheticTrack(datetime(2020, 1, 1, tzinfo=timezone.utc))
+        rcomp = RallyComputer(SyntheticSource(track))
+        rcomp.fix_log = FixLogWriter(path)
+        rcomp.fix_log.fix(rcomp.odo.lastFix)
+        rcomp.config.set_calibration = lambda calibration: None  # keep config.yaml
+        rcomp.handle_command(("zero",))
+        rcomp.handle_command(("mode", OdometerMode.DRIVE))
+        for _ in range(10):
+            rcomp.receive_update()
+        rcomp.handle_command(("calibrate", 0.1))
+        rcomp.handle_command(("undo",))
+        rcomp.handle_command(("zero",))
+        rcomp.receive_update()
+        rcomp.handle_command(("undo",))
+        raw = rcomp.odo.distanceAccumulator
+        rcomp.handle_command(("calibrate", 0.15))
+        rcomp.fix_log.close()
+        [segment] = find_segments(load_fix_log(path))
+        self.assertAlmostEqual(segment.raw, raw, 6)
+        self.assertEqual(segment.expected, 150)
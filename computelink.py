@@ -0,0 +1,250 @@
+import math
+import multiprocessing
+import os
+import select
+import selectors
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+from multiprocessing import shared_memory
+
+from rallycomp import OdometerMode, RallyComputer, RallyState
+
+# State block layout: a sequence counter, then the RallyState fields
+MESSAGE_SIZE = 64
+SEQUENCE = struct.Struct("<Q")
+FIELDS = struct.Struct("<dQdBdddddddQQQ{}s".format(MESSAGE_SIZE))
+BLOCK_SIZE = SEQUENCE.size + FIELDS.size
+
+
+def to_timestamp(value) -> float:
+    if value is None:
+        return math.nan
+    return value.timestamp()
+
+
+def from_timestamp(value: float):
+    if math.isnan(value):
+        return None
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+class StateWriter:
+    """Publishes RallyState into a shared block under a seqlock.
+
+    The sequence is odd while a write is in progress. There is a single
+    writer, so it never has to wait. Python has no memory fences, so this
+    relies on the stores becoming visible to the reader in program order.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.seq = 0
+
+    def publish(self, state: RallyState):
+        self.seq += 1
+        SEQUENCE.pack_into(self.buf, 0, self.seq)
+        FIELDS.pack_into(
+            self.buf,
+            SEQUENCE.size,
+            state.fix_time.timestamp(),
+            state.fix_count,
+            state.odometer,
+            state.mode.value,
+            state.speed,
+            state.calibration,
+            state.pace,
+            state.cast,
+            state.time_remaining.total_seconds(),
+            state.distance_remaining,
+            to_timestamp(state.current_time),
+            state.instruction_seq,
+            state.advance_seq,
+            state.message_seq,
+            state.message.encode()[:MESSAGE_SIZE],
+        )
+        self.seq += 1
+        SEQUENCE.pack_into(self.buf, 0, self.seq)
+
+
+class StateReader:
+    """Reads RallyState straight out of the shared block.
+
+    Fields are unpacked from the shared buffer itself, without copying the
+    block first; a read is retried if the writer was busy or got in between.
+    After every `retries` failed tries the reader yields, and asks alive()
+    whether the writer is still there to finish its write.
+    """
+
+    def __init__(self, buf, alive=lambda: True, retries: int = 100):
+        self.buf = buf
+        self.alive = alive
+        self.retries = retries
+
+    def read(self) -> RallyState:
+        tries = 0
+        while True:
+            before = SEQUENCE.unpack_from(self.buf, 0)[0]
+            if not before % 2:
+                fields = FIELDS.unpack_from(self.buf, SEQUENCE.size)
+                if SEQUENCE.unpack_from(self.buf, 0)[0] == before:
+                    break
+            tries += 1
+            if tries % self.retries == 0:
+                if not self.alive():
+                    raise ConnectionError("The compute process exited")
+                time.sleep(0.001)
+        return RallyState(
+            fix_time=from_timestamp(fields[0]),
+            fix_count=fields[1],
+            odometer=fields[2],
+            mode=OdometerMode(fields[3]),
+            speed=fields[4],
+            calibration=fields[5],
+            pace=fields[6],
+            cast=fields[7],
+            time_remaining=timedelta(seconds=fields[8]),
+            distance_remaining=fields[9],
+            current_time=from_timestamp(fields[10]),
+            instruction_seq=fields[11],
+            advance_seq=fields[12],
+            message_seq=fields[13],
+            message=fields[14].rstrip(b"\0").decode(errors="replace"),
+        )
+
+
+class LocalLink:
+    """Runs the RallyComputer in the display's own process"""
+
+    def __init__(self):
+        self.rcomp = RallyComputer()
+        self.rcomp.start_idle()
+        self.rcomp.source.watch()
+
+    def fileno(self) -> int:
+        return self.rcomp.source.fileno()
+
+    def timeout(self):
+        """Seconds until service() is due even if fileno() stays quiet, or None"""
+        return self.rcomp.source.timeout()
+
+    def service(self) -> bool:
+        """Call when fileno() is readable; returns True if the state changed"""
+        try:
+            return self.rcomp.receive_update()
+        except Exception as err:
+            self.rcomp.report(str(err))
+            return True
+
+    def read(self) -> RallyState:
+        return self.rcomp.get_state()
+
+    def send(self, command: tuple):
+        try:
+            self.rcomp.handle_command(command)
+        except Exception as err:
+            self.rcomp.report(str(err))
+
+    def close(self):
+        self.rcomp.close()
+
+
+def run_compute(shm, commands, notify_fd: int):
+    """Body of the compute process started by ProcessLink"""
+    writer = StateWriter(shm.buf)
+    rcomp = RallyComputer()
+    rcomp.start_idle()
+    rcomp.source.watch()
+    selector = selectors.DefaultSelector()
+    selector.register(rcomp.source, selectors.EVENT_READ, "gps")
+    selector.register(commands, selectors.EVENT_READ, "commands")
+    while True:
+        writer.publish(rcomp.get_state())
+        try:
+            os.write(notify_fd, b"\0")
+        except BlockingIOError:
+            pass  # The display is behind; it will read the latest state anyway
+        events = selector.select(rcomp.source.timeout())
+        if not events:
+            # A fix held back for a quiet receiver is due
+            events = [(selector.get_key(rcomp.source), selectors.EVENT_READ)]
+        for key, _ in events:
+            try:
+                if key.data == "gps":
+                    rcomp.receive_update()
+                else:
+                    command = commands.recv()
+                    if command[0] == "quit":
+                        rcomp.close()
+                        return
+                    rcomp.handle_command(command)
+            except EOFError:
+                rcomp.close()
+                return
+            except Exception as err:
+                rcomp.report(str(err))
+
+
+class ProcessLink:
+    """Runs the RallyComputer in a child process.
+
+    The child publishes its state into a shared memory block and writes a
+    byte to a pipe after each update, so the display can sleep on fileno().
+    The notify pipe never blocks the child; a slow display just skips states.
+    Commands go the other way over a multiprocessing pipe.
+    """
+
+    def __init__(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=BLOCK_SIZE)
+        self.reader = StateReader(self.shm.buf, lambda: self.process.is_alive())
+        self.notify_fd, notify_write = os.pipe()
+        os.set_blocking(notify_write, False)
+        self.commands, child_commands = multiprocessing.Pipe()
+        # fork, so the child can share the SharedMemory object and the raw pipe
+        context = multiprocessing.get_context("fork")
+        self.process = context.Process(
+            target=run_compute,
+            args=(self.shm, child_commands, notify_write),
+            daemon=True,
+        )
+        self.process.start()
+        os.close(notify_write)
+        child_commands.close()
+        # The child publishes once it has a fix
+        select.select([self.notify_fd], [], [])
+        self.service()
+        os.set_blocking(self.notify_fd, False)
+
+    def fileno(self) -> int:
+        return self.notify_fd
+
+    def timeout(self):
+        """The compute process keeps its own time, so never"""
+        return None
+
+    def service(self) -> bool:
+        """Call when fileno() is readable; returns True if the state changed"""
+        try:
+            data = os.read(self.notify_fd, 4096)
+        except BlockingIOError:
+            return False
+        if not data:
+            raise ConnectionError("The compute process exited")
+        return True
+
+    def read(self) -> RallyState:
+        return self.reader.read()
+
+    def send(self, command: tuple):
+        self.commands.send(command)
+
+    def close(self):
+        if self.process.is_alive():
+            self.commands.send(("quit",))
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.terminate()
+        os.close(self.notify_fd)
+        self.reader = None
+        self.shm.close()
+        self.shm.unlink()
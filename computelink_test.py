@@ -0,0 +1,52 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from computelink import BLOCK_SIZE, SEQUENCE, StateReader, StateWriter
+from rallycomp import OdometerMode, RallyState
+
+
+class TestStateBlock(unittest.TestCase):
+    def test_round_trip(self):
+        buf = bytearray(BLOCK_SIZE)
+        writer = StateWriter(memoryview(buf))
+        state = RallyState(
+            fix_time=datetime(2020, 1, 1, 0, 0, 1, 500000, tzinfo=timezone.utc),
+            fix_count=42,
+            odometer=1234.5,
+            mode=OdometerMode.REVERSE,
+            speed=50.0,
+            calibration=1.01,
+            pace=-0.25,
+            cast=48.0,
+            time_remaining=timedelta(seconds=90.5),
+            distance_remaining=800.0,
+            current_time=None,
+            instruction_seq=3,
+            advance_seq=2,
+            message="Cal: 1.01",
+            message_seq=7,
+        )
+        writer.publish(state)
+        read = StateReader(memoryview(buf)).read()
+        self.assertEqual(writer.seq, 2)
+        self.assertEqual(read.fix_time, state.fix_time)
+        self.assertEqual(read.mode, OdometerMode.REVERSE)
+        self.assertEqual(read.time_remaining, state.time_remaining)
+        self.assertIsNone(read.current_time)
+        self.assertEqual(read.instruction_seq, 3)
+        self.assertEqual(read.advance_seq, 2)
+        self.assertEqual(read.message, "Cal: 1.01")
+        self.assertEqual(read.message_seq, 7)
+
+    def test_read_gives_up_when_writer_died_mid_write(self):
+        buf = bytearray(BLOCK_SIZE)
+        SEQUENCE.pack_into(buf, 0, 1)
+        checks = []
+
+        def alive():
+            checks.append(True)
+            return len(checks) < 3
+
+        reader = StateReader(memoryview(buf), alive, retries=10)
+        with self.assertRaises(ConnectionError):
+            reader.read()
+        self.assertEqual(len(checks), 3)
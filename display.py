@@ -1,10 +1,15 @@
+import collections
+import copy
 import curses
-import curses.textpad
 import datetime
+import selectors
 import sys
 import time
 import traceback
-from rallycomp import Config, Instruction, OdometerMode, RallyComputer
+from typing import Optional
+from computelink import LocalLink, ProcessLink
+from pacetable import PaceTable, format_elapsed, load_pace_table
+from rallycomp import Config, Instruction, OdometerMode, RallyState
 import math
 from dateutil import parser
 
@@ -20,7 +25,7 @@ def update_instruction(
     command: str,
     value: str,
     config: Config,
-    current: Instruction,
+    current_time: datetime.datetime,
 ):
     if command == "c":
         to_set = config.input_to_units(float(value))
@@ -35,21 +40,363 @@ def update_instruction(
     elif command == "p":
         instruction.speed = 0
         seconds = float(value)
-        instruction.absolute_time = current.absolute_time + datetime.timedelta(
-            seconds=seconds
-        )
+        instruction.absolute_time = current_time + datetime.timedelta(seconds=seconds)
     else:
         raise Exception("Unknown command: " + command)
 
 
-def activate_window(win):
-    win.bkgd(" ", curses.color_pair(2))
-    win.refresh()
-
-
-def deactivate_window(win):
-    win.bkgd(" ", curses.color_pair(1))
-    win.refresh()
+def enter_instruction(
+    link,
+    config: Config,
+    instruction: Instruction,
+    advance_seq: int,
+    command: str,
+    value: str,
+):
+    """Applies an edit to the next instruction, queueing it if complete.
+
+    advance_seq is the computer's count of started queued instructions when
+    the display last caught up. If it has moved, the instruction being
+    edited has already started, so the edit is refused.
+    """
+    state = link.read()
+    if state.advance_seq != advance_seq:
+        raise ValueError("Next instruction already started")
+    update_instruction(instruction, command, value, config, state.current_time)
+    if config.get_auto_advance() and instruction.verify():
+        link.send(("queue", instruction, advance_seq))
+
+
+def odometer_command(link, undo, value: str):
+    if value.lower().startswith("d"):
+        link.send(("mode", OdometerMode.DRIVE))
+    elif value.lower().startswith("r"):
+        link.send(("mode", OdometerMode.REVERSE))
+    elif value.lower().startswith("p"):
+        link.send(("mode", OdometerMode.PARK))
+    elif value.lower().startswith("c"):
+        return LineEditor("Enter expected odometer", calibrate_command, link, undo)
+    elif value.lower().startswith("z"):
+        undo.append(None)
+        link.send(("zero",))
+    else:
+        raise ValueError("Unknown mode! [D][R][P][C][Z]")
+
+
+def calibrate_command(link, undo, value: str):
+    expected = float(value)
+    undo.append(None)
+    link.send(("calibrate", expected))
+
+
+class UndoHistory:
+    """The next instruction from before each command the computer can undo.
+
+    Undoing a start only gives that instruction back if the computer really
+    went back to the one before, which shows as a lower instruction_seq in
+    the first state with the undo's message.
+    """
+
+    def __init__(self, depth: int):
+        self.saved = collections.deque(maxlen=depth)
+        self.pending = None  # (instruction, instruction_seq, message_seq)
+
+    def append(self, instruction: Optional[Instruction]):
+        self.saved.append(instruction)
+
+    def send(self, link):
+        state = link.read()
+        instruction = self.saved.pop() if self.saved else None
+        self.pending = (instruction, state.instruction_seq, state.message_seq)
+        link.send(("undo",))
+
+    def restored(self, state: RallyState) -> Optional[Instruction]:
+        """The next instruction to show again once the undo has been handled"""
+        if self.pending is None or state.message_seq == self.pending[2]:
+            return None
+        instruction, instruction_seq, _ = self.pending
+        self.pending = None
+        if state.instruction_seq < instruction_seq:
+            return instruction
+        return None
+
+
+class LineEditor:
+    """Collects a command's text one key at a time, so the main loop never blocks.
+
+    When Enter is pressed, on_enter is called with args and the text. It may
+    return another LineEditor to ask a follow-up question.
+    """
+
+    def __init__(self, title: str, on_enter, *args):
+        self.title = title
+        self.text = ""
+        self.on_enter = on_enter
+        self.args = args
+
+    def feed(self, key: int):
+        """Handles a key; returns the editor still collecting input, if any"""
+        if key in (10, 13, curses.KEY_ENTER):
+            return self.on_enter(*self.args, self.text)
+        if key == 27:  # Escape
+            return None
+        if key in (8, 127, curses.KEY_BACKSPACE):
+            self.text = self.text[:-1]
+        elif 32 <= key < 127:
+            self.text = self.text + chr(key)
+        return self
+
+
+def draw_screen(
+    state: RallyState,
+    config: Config,
+    next_instrucion: Instruction,
+    initialized: bool,
+    errorStr: str,
+    wakeup_rate: float,
+    pace_table: Optional[PaceTable] = None,
+    editor: Optional[LineEditor] = None,
+):
+    # Header
+    localtime = state.fix_time.astimezone(config.get_timezone())
+    time_string = localtime.strftime("%H:%M:%S.%f")[:-3]
+    headerWindow = curses.newwin(3, curses.COLS - 1, 1, 1)
+    headerWindow.bkgd(" ", curses.color_pair(1))
+    headerWindow.box()
+    if initialized:
+        headerWindow.addstr(1, 1, "Rally Computer", curses.color_pair(1))
+    else:
+        headerWindow.addstr(1, 1, "Initializing...", curses.color_pair(1))
+    headerWindow.addstr(
+        1,
+        int(headerWindow.getmaxyx()[1] / 2) - 6,
+        time_string,
+        curses.color_pair(1),
+    )
+    wakeup_string = "{:.1f} wk/s".format(wakeup_rate)
+    headerWindow.addstr(
+        1,
+        headerWindow.getmaxyx()[1] - len(wakeup_string) - 2,
+        wakeup_string,
+        curses.color_pair(1),
+    )
+    headerWindow.refresh()
+
+    # Pace
+    pace = state.pace
+    paceWin = curses.newwin(5, curses.COLS - 1, 4, 1)
+    paceColor = curses.color_pair(2)
+    if pace > 0.5:
+        paceColor = curses.color_pair(4)  # red
+    elif pace < -0.5:
+        paceColor = curses.color_pair(3)  # yellow
+    else:
+        paceColor = curses.color_pair(2)  # green
+    paceWin.bkgd(" ", paceColor)
+    paceWin.box()
+    pace_width = paceWin.getmaxyx()[1]
+    minus10 = atan_position(pace_width, -10)
+    minus5 = atan_position(pace_width, -5)
+    minus1 = atan_position(pace_width, -1)
+    zero = atan_position(pace_width, 0)
+    plus1 = atan_position(pace_width, 1) - 2
+    plus5 = atan_position(pace_width, 5) - 2
+    plus10 = atan_position(pace_width, 10) - 3
+    paceWin.addstr(1, minus10, "-10", paceColor)
+    paceWin.addstr(1, minus5, "-5", paceColor)
+    paceWin.addstr(1, minus1, "-1", paceColor)
+    paceWin.addstr(1, zero, "0", paceColor)
+    paceWin.addstr(1, plus1, "1", paceColor)
+    paceWin.addstr(1, plus5, "5", paceColor)
+    paceWin.addstr(1, plus10, "10", paceColor)
+
+    shaded_area = "_" * (plus1 - minus1)
+    paceWin.addstr(2, minus1 + 1, shaded_area, paceColor)
+
+    cursor_position = atan_position(pace_width, state.pace)
+    if cursor_position < 1:
+        cursor_position = 1
+    if cursor_position > (pace_width - 2):
+        cursor_position = pace_width - 2
+    paceWin.addstr(2, cursor_position, "█", paceColor)
+
+    paceWin.addstr(3, 1, "Speed up!", paceColor)
+    paceWin.addstr(3, pace_width - 11, "Slow down!", paceColor)
+    paceWin.refresh()
+
+    # Odometer
+    odo_value = config.to_display_units(state.odometer / 1000)
+    odo_string = "{:3.3f}".format(odo_value)
+    odo_mode_string = state.mode.name
+    unit_str = config.get_unit_name()
+    odometerWindow = curses.newwin(5, 20, 9, 1)
+    odometerWindow.bkgd(" ", curses.color_pair(1))
+    odometerWindow.box()
+    odometerWindow.addstr(1, 1, "[O]dometer", curses.color_pair(1) | curses.A_BOLD)
+    odometerWindow.addstr(2, 2, unit_str, curses.color_pair(1))
+    odometerWindow.addstr(
+        2, odometerWindow.getmaxyx()[1] - 8, odo_string, curses.color_pair(1)
+    )
+    odometerWindow.addstr(3, 2, "Mode:", curses.color_pair(1))
+    odometerWindow.addstr(
+        3,
+        odometerWindow.getmaxyx()[1] - (len(odo_mode_string) + 1),
+        odo_mode_string,
+        curses.color_pair(1),
+    )
+    odometerWindow.refresh()
+
+    # Speedometer
+    speed_str = "{:2.5f}".format(config.to_display_units(state.speed))
+    speedWin = curses.newwin(5, 20, 9, 21)
+    speedWin.bkgd(" ", curses.color_pair(1))
+    speedWin.box()
+    speedWin.addstr(1, 1, "Speedometer", curses.color_pair(1) | curses.A_BOLD)
+    speedWin.addstr(2, 2, unit_str + "/h:", curses.color_pair(1))
+    speedWin.addstr(2, speedWin.getmaxyx()[1] - 9, speed_str, curses.color_pair(1))
+    speedWin.refresh()
+
+    # Pace Table
+    if pace_table is not None:
+        table_distance, table_seconds = pace_table.row(
+            config.to_display_units(state.odometer / 1000)
+        )
+        table_distance_str = "{:3.2f}".format(table_distance)
+        table_time_str = format_elapsed(table_seconds)
+        tableWin = curses.newwin(5, 20, 9, 41)
+        tableWin.bkgd(" ", curses.color_pair(1))
+        tableWin.box()
+        tableWin.addstr(1, 1, "Pace Table", curses.color_pair(1) | curses.A_BOLD)
+        tableWin.addstr(2, 2, unit_str, curses.color_pair(1))
+        tableWin.addstr(
+            2,
+            tableWin.getmaxyx()[1] - len(table_distance_str) - 1,
+            table_distance_str,
+            curses.color_pair(1),
+        )
+        tableWin.addstr(3, 2, "ideal:", curses.color_pair(1))
+        tableWin.addstr(
+            3,
+            tableWin.getmaxyx()[1] - len(table_time_str) - 1,
+            table_time_str,
+            curses.color_pair(1),
+        )
+        tableWin.refresh()
+
+    # Current Instruction
+    cast_str = "{:2.2f}".format(config.to_display_units(state.cast))
+    offset_str = "{:2.2f}".format(state.pace)
+    time_remaining_str = str(state.time_remaining)
+    if len(time_remaining_str) > 11:
+        time_remaining_str = time_remaining_str[:11]
+    dist_remaining_str = "{:3.3f}".format(state.distance_remaining / 1000)
+    currWin = curses.newwin(9, 30, 14, 1)
+    currWin.bkgd(" ", curses.color_pair(1))
+    currWin.box()
+    currWin.addstr(1, 1, "Current Instruction", curses.color_pair(1) | curses.A_BOLD)
+    currWin.addstr(2, 2, "time remaining:", curses.color_pair(1))
+    currWin.addstr(
+        2,
+        currWin.getmaxyx()[1] - len(time_remaining_str) - 1,
+        time_remaining_str,
+        curses.color_pair(1),
+    )
+    currWin.addstr(3, 2, "dist remaining", curses.color_pair(1))
+    currWin.addstr(
+        3,
+        currWin.getmaxyx()[1] - len(dist_remaining_str) - 1,
+        dist_remaining_str,
+        curses.color_pair(1),
+    )
+    currWin.addstr(4, 2, "CAST:", curses.color_pair(1))
+    currWin.addstr(4, currWin.getmaxyx()[1] - 6, cast_str, curses.color_pair(1))
+    currWin.addstr(5, 2, "pace:", curses.color_pair(1))
+    currWin.addstr(5, currWin.getmaxyx()[1] - 7, offset_str, curses.color_pair(1))
+    if state.pace > 0.5:
+        currWin.addstr(6, currWin.getmaxyx()[1] - 10, "Slow down", curses.color_pair(1))
+    elif state.pace < -0.5:
+        currWin.addstr(6, currWin.getmaxyx()[1] - 10, "Speed up!", curses.color_pair(1))
+    else:
+        currWin.addstr(
+            6,
+            int(currWin.getmaxyx()[1]) - 10,
+            "Right On!",
+            curses.color_pair(1),
+        )
+    currWin.refresh()
+
+    # Next Instruction
+    nextActTime = next_instrucion.get_time().strftime("%H:%M:%S")
+    nextActDist = "{:3.3f}".format(
+        config.to_display_units(next_instrucion.get_distance())
+    )
+    nextActCast = "{:2.2f}".format(config.to_display_units(next_instrucion.get_speed()))
+    nextWin = curses.newwin(8, 30, 14, 31)
+    nextWin.bkgd(" ", curses.color_pair(1))
+    nextWin.box()
+    nextWin.addstr(1, 1, "Next Instruction", curses.color_pair(1) | curses.A_BOLD)
+    nextWin.addstr(2, 2, "actual [t]ime:", curses.color_pair(1))
+    nextWin.addstr(2, nextWin.getmaxyx()[1] - 9, nextActTime, curses.color_pair(1))
+    nextWin.addstr(3, 2, "[d]istance:", curses.color_pair(1))
+    nextWin.addstr(3, nextWin.getmaxyx()[1] - 8, nextActDist, curses.color_pair(1))
+    nextWin.addstr(4, 2, "[C]AST:", curses.color_pair(1))
+    nextWin.addstr(4, nextWin.getmaxyx()[1] - 6, nextActCast, curses.color_pair(1))
+    nextWin.refresh()
+
+    # Command
+    commandColor = curses.color_pair(1)
+    if editor is not None:
+        commandColor = curses.color_pair(2)
+    commandTitlewin = curses.newwin(3, 30, 24, 1)
+    commandTitlewin.bkgd(" ", commandColor)
+    commandTitlewin.box()
+    if editor is not None:
+        commandTitlewin.addstr(1, 1, editor.title, commandColor)
+    commandTitlewin.refresh()
+
+    commandWin = curses.newwin(1, 30, 27, 1)
+    commandWin.bkgd(" ", commandColor)
+    if editor is not None:
+        commandWin.addstr(0, 0, editor.text[-29:], commandColor)
+    commandWin.refresh()
+
+    # Errors
+    errorWin = curses.newwin(5, 20, 24, 31)
+    errorWin.bkgd(" ", curses.color_pair(1))
+    errorWin.box()
+    errorWin.addstr(1, 1, "Errors", curses.color_pair(1) | curses.A_BOLD)
+    errorWin.addstr(2, 1, errorStr, curses.color_pair(1))
+    errorWin.refresh()
+
+
+class WakeupCounter:
+    """Counts main loop wake-ups and reports them per second"""
+
+    def __init__(self):
+        self.rate = 0.0
+        self.count = 0
+        self.window_start = time.monotonic()
+
+    def tick(self, now: float) -> bool:
+        """Records a wake-up; returns True when the rate has been refreshed"""
+        self.count += 1
+        elapsed = now - self.window_start
+        if elapsed < 1:
+            return False
+        self.rate = self.count / elapsed
+        self.count = 0
+        self.window_start = now
+        return True
+
+
+def read_keys(stdscr) -> list:
+    """Drains every key curses has buffered; stdscr must be in nodelay mode"""
+    keys = []
+    key = stdscr.getch()
+    while key != -1:
+        keys.append(key)
+        key = stdscr.getch()
+    return keys
 
 
 def main(argv):
@@ -80,329 +427,148 @@ def main(argv):
     curses.init_pair(3, curses.COLOR_WHITE, curses.COLOR_YELLOW)
     curses.init_pair(4, curses.COLOR_WHITE, curses.COLOR_RED)
     caughtExceptions = ""
+    link = None
     try:
         initialized = False
 
-        rcomp = RallyComputer()
-
-        current_instruction = Instruction(distance_km=0, speed_kmh=0, dummy=True)
-        rcomp.start_instruction(current_instruction)
-        rcomp.odo.mode = OdometerMode.PARK
+        config = Config("config.yaml")
+        # Either way, the RallyComputer is only reached through the link
+        if config.get_split_processes():
+            link = ProcessLink()
+        else:
+            link = LocalLink()
 
         next_instrucion = Instruction()
+        pace_table = load_pace_table(config)
+        editor = None
+        # The next instruction before each command the computer can undo
+        undo = UndoHistory(config.get_undo_depth())
 
         commandStr = ""
         errorStr = ""
-
-        while True:
-            # Header
-            localtime = rcomp.odo.lastFix.timestamp.astimezone(
-                rcomp.config.get_timezone()
-            )
-            time_string = localtime.strftime("%H:%M:%S.%f")[:-3]
-            headerWindow = curses.newwin(3, curses.COLS - 1, 1, 1)
-            headerWindow.bkgd(" ", curses.color_pair(1))
-            headerWindow.box()
-            if initialized:
-                headerWindow.addstr(1, 1, "Rally Computer", curses.color_pair(1))
-            else:
-                headerWindow.addstr(1, 1, "Initializing...", curses.color_pair(1))
-            headerWindow.addstr(
-                1,
-                int(headerWindow.getmaxyx()[1] / 2) - 6,
-                time_string,
-                curses.color_pair(1),
-            )
-            headerWindow.refresh()
-
-            # Pace
-            pace = rcomp.cast.get_offset()
-            paceWin = curses.newwin(5, curses.COLS - 1, 4, 1)
-            paceColor = curses.color_pair(2)
-            if pace > 0.5:
-                paceColor = curses.color_pair(4)  # red
-            elif pace < -0.5:
-                paceColor = curses.color_pair(3)  # yellow
-            else:
-                paceColor = curses.color_pair(2)  # green
-            paceWin.bkgd(" ", paceColor)
-            paceWin.box()
-            pace_width = paceWin.getmaxyx()[1]
-            minus10 = atan_position(pace_width, -10)
-            minus5 = atan_position(pace_width, -5)
-            minus1 = atan_position(pace_width, -1)
-            zero = atan_position(pace_width, 0)
-            plus1 = atan_position(pace_width, 1) - 2
-            plus5 = atan_position(pace_width, 5) - 2
-            plus10 = atan_position(pace_width, 10) - 3
-            paceWin.addstr(1, minus10, "-10", paceColor)
-            paceWin.addstr(1, minus5, "-5", paceColor)
-            paceWin.addstr(1, minus1, "-1", paceColor)
-            paceWin.addstr(1, zero, "0", paceColor)
-            paceWin.addstr(1, plus1, "1", paceColor)
-            paceWin.addstr(1, plus5, "5", paceColor)
-            paceWin.addstr(1, plus10, "10", paceColor)
-
-            shaded_area = "_" * (plus1 - minus1)
-            paceWin.addstr(2, minus1 + 1, shaded_area, paceColor)
-
-            cursor_position = atan_position(pace_width, rcomp.cast.get_offset())
-            if cursor_position < 1:
-                cursor_position = 1
-            if cursor_position > (pace_width - 2):
-                cursor_position = pace_width - 2
-            paceWin.addstr(2, cursor_position, "█", paceColor)
-
-            paceWin.addstr(3, 1, "Speed up!", paceColor)
-            paceWin.addstr(3, pace_width - 11, "Slow down!", paceColor)
-            paceWin.refresh()
-
-            # Odometer
-            odo_value = rcomp.config.to_display_units(
-                rcomp.odo.get_accumulated_distance() / 1000
-            )
-            odo_string = "{:3.3f}".format(odo_value)
-            odo_mode_string = rcomp.odo.mode.name
-            unit_str = rcomp.config.get_unit_name()
-            odometerWindow = curses.newwin(5, 20, 9, 1)
-            odometerWindow.bkgd(" ", curses.color_pair(1))
-            odometerWindow.box()
-            odometerWindow.addstr(
-                1, 1, "[O]dometer", curses.color_pair(1) | curses.A_BOLD
-            )
-            odometerWindow.addstr(2, 2, unit_str, curses.color_pair(1))
-            odometerWindow.addstr(
-                2, odometerWindow.getmaxyx()[1] - 8, odo_string, curses.color_pair(1)
-            )
-            odometerWindow.addstr(3, 2, "Mode:", curses.color_pair(1))
-            odometerWindow.addstr(
-                3,
-                odometerWindow.getmaxyx()[1] - (len(odo_mode_string) + 1),
-                odo_mode_string,
-                curses.color_pair(1),
-            )
-            odometerWindow.refresh()
-
-            # Speedometer
-            speed_str = "{:2.5f}".format(
-                rcomp.config.to_display_units(rcomp.odo.get_last_speed())
-            )
-            speedWin = curses.newwin(5, 20, 9, 21)
-            speedWin.bkgd(" ", curses.color_pair(1))
-            speedWin.box()
-            speedWin.addstr(1, 1, "Speedometer", curses.color_pair(1) | curses.A_BOLD)
-            speedWin.addstr(2, 2, unit_str + "/h:", curses.color_pair(1))
-            speedWin.addstr(
-                2, speedWin.getmaxyx()[1] - 9, speed_str, curses.color_pair(1)
-            )
-            speedWin.refresh()
-
-            # Current Instruction
-            cast_str = "{:2.2f}".format(
-                rcomp.config.to_display_units(rcomp.cast.average)
-            )
-            offset_str = "{:2.2f}".format(rcomp.cast.get_offset())
-            time_remaining_str = str(rcomp.current_instruction.get_time_remaining())
-            if len(time_remaining_str) > 11:
-                time_remaining_str = time_remaining_str[:11]
-            dist_remaining_str = "{:3.3f}".format(
-                rcomp.current_instruction.get_distance_remaining() / 1000
-            )
-            currWin = curses.newwin(9, 30, 14, 1)
-            currWin.bkgd(" ", curses.color_pair(1))
-            currWin.box()
-            currWin.addstr(
-                1, 1, "Current Instruction", curses.color_pair(1) | curses.A_BOLD
-            )
-            currWin.addstr(2, 2, "time remaining:", curses.color_pair(1))
-            currWin.addstr(
-                2,
-                currWin.getmaxyx()[1] - len(time_remaining_str) - 1,
-                time_remaining_str,
-                curses.color_pair(1),
-            )
-            currWin.addstr(3, 2, "dist remaining", curses.color_pair(1))
-            currWin.addstr(
-                3,
-                currWin.getmaxyx()[1] - len(dist_remaining_str) - 1,
-                dist_remaining_str,
-                curses.color_pair(1),
-            )
-            currWin.addstr(4, 2, "CAST:", curses.color_pair(1))
-            currWin.addstr(4, currWin.getmaxyx()[1] - 6, cast_str, curses.color_pair(1))
-            currWin.addstr(5, 2, "pace:", curses.color_pair(1))
-            currWin.addstr(
-                5, currWin.getmaxyx()[1] - 7, offset_str, curses.color_pair(1)
-            )
-            if rcomp.cast.get_offset() > 0.5:
-                currWin.addstr(
-                    6, currWin.getmaxyx()[1] - 10, "Slow down", curses.color_pair(1)
-                )
-            elif rcomp.cast.get_offset() < -0.5:
-                currWin.addstr(
-                    6, currWin.getmaxyx()[1] - 10, "Speed up!", curses.color_pair(1)
+        message_seq = 0
+        instruction_seq = link.read().instruction_seq
+        advance_seq = link.read().advance_seq
+
+        selector = selectors.DefaultSelector()
+        selector.register(sys.stdin, selectors.EVENT_READ, "keys")
+        selector.register(link, selectors.EVENT_READ, "computer")
+        wakeups = WakeupCounter()
+        frame_interval = 1 / config.get_max_fps()
+        next_frame = 0.0
+        dirty = True
+        running = True
+
+        while running:
+            # Only repaint on a state change, and no faster than max_fps
+            now = time.monotonic()
+            if dirty and now >= next_frame:
+                state = link.read()
+                if state.message_seq != message_seq:
+                    message_seq = state.message_seq
+                    errorStr = state.message
+                if state.advance_seq != advance_seq:
+                    # The computer has started the queued next instruction
+                    advance_seq = state.advance_seq
+                    next_instrucion = Instruction()
+                restored = undo.restored(state)
+                if restored is not None:
+                    next_instrucion = restored
+                if state.instruction_seq > instruction_seq:
+                    # The next instruction keeps the CAST of the one started
+                    if next_instrucion.speed is None:
+                        next_instrucion.set_speed(state.cast)
+                        if config.get_auto_advance() and next_instrucion.verify():
+                            link.send(("queue", next_instrucion, advance_seq))
+                # Lower after an undo
+                instruction_seq = state.instruction_seq
+                draw_screen(
+                    state,
+                    config,
+                    next_instrucion,
+                    initialized,
+                    errorStr,
+                    wakeups.rate,
+                    pace_table,
+                    editor,
                 )
-            else:
-                currWin.addstr(
-                    6,
-                    int(currWin.getmaxyx()[1]) - 10,
-                    "Right On!",
-                    curses.color_pair(1),
-                )
-            currWin.refresh()
-
-            # Next Instruction
-            nextActTime = next_instrucion.get_time().strftime("%H:%M:%S")
-            nextActDist = "{:3.3f}".format(
-                rcomp.config.to_display_units(next_instrucion.get_distance())
-            )
-            nextActCast = "{:2.2f}".format(
-                rcomp.config.to_display_units(next_instrucion.get_speed())
-            )
-            nextWin = curses.newwin(8, 30, 14, 31)
-            nextWin.bkgd(" ", curses.color_pair(1))
-            nextWin.box()
-            nextWin.addstr(
-                1, 1, "Next Instruction", curses.color_pair(1) | curses.A_BOLD
-            )
-            nextWin.addstr(2, 2, "actual [t]ime:", curses.color_pair(1))
-            nextWin.addstr(
-                2, nextWin.getmaxyx()[1] - 9, nextActTime, curses.color_pair(1)
-            )
-            nextWin.addstr(3, 2, "[d]istance:", curses.color_pair(1))
-            nextWin.addstr(
-                3, nextWin.getmaxyx()[1] - 8, nextActDist, curses.color_pair(1)
-            )
-            nextWin.addstr(4, 2, "[C]AST:", curses.color_pair(1))
-            nextWin.addstr(
-                4, nextWin.getmaxyx()[1] - 6, nextActCast, curses.color_pair(1)
-            )
-            nextWin.refresh()
-
-            # Command
-            commandTitlewin = curses.newwin(3, 30, 24, 1)
-            commandTitlewin.bkgd(" ", curses.color_pair(1))
-            commandTitlewin.box()
-            commandTitlewin.refresh()
-
-            commandWin = curses.newwin(1, 30, 27, 1)
-            commandWin.bkgd(" ", curses.color_pair(1))
-            commandBox = curses.textpad.Textbox(commandWin)
-            commandWin.refresh()
-
-            # Errors
-            errorWin = curses.newwin(5, 20, 24, 31)
-            errorWin.bkgd(" ", curses.color_pair(1))
-            errorWin.box()
-            errorWin.addstr(1, 1, "Errors", curses.color_pair(1) | curses.A_BOLD)
-            errorWin.addstr(2, 1, errorStr, curses.color_pair(1))
-            errorWin.refresh()
-
-            try:
-                rcomp.try_update()
-            except Exception as err:
-                errorStr = str(err)
-
-            time.sleep(0.05)
-            initialized = True
+                initialized = True
+                dirty = False
+                next_frame = now + frame_interval
+
+            # Sleep until a key or a fix arrives
+            timeout = link.timeout()
+            if dirty:
+                frame_timeout = max(next_frame - now, 0)
+                if timeout is None or frame_timeout < timeout:
+                    timeout = frame_timeout
+            events = selector.select(timeout)
+            if link.timeout() == 0 and all(key.data != "computer" for key, _ in events):
+                # A fix held back for a quiet receiver is due
+                events.append((selector.get_key(link), selectors.EVENT_READ))
+            if wakeups.tick(time.monotonic()):
+                dirty = True
+
+            pending_keys = []
+            for selectorKey, _ in events:
+                if selectorKey.data == "computer":
+                    if link.service():
+                        dirty = True
+                else:
+                    pending_keys = read_keys(stdscr)
 
             # Command Keys
             commandKeys = {
-                "c": ("CAST", update_instruction),
-                "d": ("Distance", update_instruction),
-                "t": ("Time", update_instruction),
-                "p": ("Pause", update_instruction),
+                "c": ("CAST", enter_instruction),
+                "d": ("Distance", enter_instruction),
+                "t": ("Time", enter_instruction),
+                "p": ("Pause", enter_instruction),
             }
 
-            # Grabs a value from the keyboard without Enter having to be pressed (see cbreak above)
-            key = stdscr.getch()
-            if key == ord("q"):
-                break
-            if key > 0 and chr(key) in commandKeys.keys():
-                errorStr = ""
-                commandName = commandKeys[chr(key)][0]
-                commandFunction = commandKeys[chr(key)][1]
-                commandTitlewin.clear()
-                activate_window(commandTitlewin)
-                commandTitlewin.box()
-                commandTitlewin.addstr(1, 1, commandName, curses.color_pair(2))
-                commandTitlewin.refresh()
-
-                commandWin.clear()
-                activate_window(commandWin)
-                commandBox.edit()
-                text = commandBox.gather()
-                try:
-                    commandFunction(
+            for key in pending_keys:
+                dirty = True
+                # While a command is being typed, every key belongs to it
+                if editor is not None:
+                    try:
+                        editor = editor.feed(key)
+                    except Exception as err:
+                        errorStr = str(err)
+                        editor = None
+                    continue
+                if key == ord("q"):
+                    running = False
+                    break
+                if key > 0 and chr(key) in commandKeys.keys():
+                    errorStr = ""
+                    commandName = commandKeys[chr(key)][0]
+                    commandFunction = commandKeys[chr(key)][1]
+                    editor = LineEditor(
+                        commandName,
+                        commandFunction,
+                        link,
+                        config,
                         next_instrucion,
+                        advance_seq,
                         chr(key),
-                        text,
-                        rcomp.config,
-                        current_instruction,
                     )
-                except Exception as err:
-                    errorStr = str(err)
-                text = ""
-                commandWin.clear()
-                deactivate_window(commandWin)
-                commandTitlewin.clear()
-                deactivate_window(commandTitlewin)
-            if key == ord(" "):
-                errorStr = ""
-                if next_instrucion.verify():
-                    if current_instruction.dummy:
-                        rcomp.odo.reset()
-                    current_instruction = next_instrucion
-                    rcomp.start_instruction(current_instruction)
-                    next_instrucion = Instruction(
-                        speed_kmh=current_instruction.get_speed()
+                if key == ord(" "):
+                    errorStr = ""
+                    if link.read().advance_seq != advance_seq:
+                        errorStr = "Next instruction already started"
+                    elif next_instrucion.verify():
+                        undo.append(copy.copy(next_instrucion))
+                        link.send(("start", next_instrucion))
+                        next_instrucion = Instruction()
+                    else:
+                        errorStr = "Instruction is not valid!"
+                if key == ord("o"):
+                    errorStr = ""
+                    editor = LineEditor(
+                        "Odometer [D][R][P][C][Z]", odometer_command, link, undo
                     )
-                else:
-                    errorStr = "Instruction is not valid!"
-            if key == ord("o"):
-                errorStr = ""
-                commandTitlewin.clear()
-                activate_window(commandTitlewin)
-                commandTitlewin.box()
-                commandTitlewin.addstr(
-                    1, 1, "Odometer [D][R][P][C][Z]", curses.color_pair(2)
-                )
-                commandTitlewin.refresh()
-
-                commandWin.clear()
-                activate_window(commandWin)
-                commandBox.edit()
-                text = commandBox.gather()
-                if text.lower().startswith("d"):
-                    rcomp.odo.mode = OdometerMode.DRIVE
-                elif text.lower().startswith("r"):
-                    rcomp.odo.mode = OdometerMode.REVERSE
-                elif text.lower().startswith("p"):
-                    rcomp.odo.mode = OdometerMode.PARK
-                elif text.lower().startswith("c"):
-                    commandTitlewin.clear()
-                    activate_window(commandTitlewin)
-                    commandTitlewin.box()
-                    commandTitlewin.addstr(
-                        1, 1, "Enter expected odometer", curses.color_pair(2)
-                    )
-                    commandTitlewin.refresh()
-
-                    commandWin.clear()
-                    activate_window(commandWin)
-                    commandBox.edit()
-                    text = commandBox.gather()
-                    try:
-                        expected_distance = float(text)
-                        rcomp.odo.calibrate(expected_distance)
-                        rcomp.config.set_calibration(rcomp.odo.calibration)
-                        errorStr = "Cal: {}".format(rcomp.odo.calibration)
-                    except Exception as err:
-                        errorStr = str(err)
-                elif text.lower().startswith("z"):
-                    rcomp.odo.reset()
-                else:
-                    errorStr = "Unknown mode! [D][R][P][C][Z]"
+                if key == ord("u"):
+                    errorStr = ""
+                    undo.send(link)
 
     except Exception as err:
         # Just printing from here will not work, as the program is still set to
@@ -411,6 +577,9 @@ def main(argv):
         caughtExceptions = str(err)
         caughtExceptions += str(traceback.format_exc())
 
+    if link is not None:
+        link.close()
+
     # BEGIN ncurses shutdown/deinitialization...
     # Turn off cbreak mode...
     curses.nocbreak()
@@ -0,0 +1,100 @@
+import unittest
+from types import SimpleNamespace
+from display import LineEditor, UndoHistory, enter_instruction, odometer_command
+from rallycomp import Config, Instruction, OdometerMode
+
+
+class RecordingLink:
+    def __init__(self, advance_seq=0):
+        self.sent = []
+        self.state = SimpleNamespace(
+            advance_seq=advance_seq,
+            current_time=None,
+            instruction_seq=3,
+            message_seq=0,
+        )
+
+    def read(self):
+        return self.state
+
+    def send(self, command):
+        self.sent.append(command)
+
+
+def type_keys(editor, text):
+    for char in text:
+        editor = editor.feed(ord(char))
+    return editor
+
+
+class TestLineEditor(unittest.TestCase):
+    def test_typing_and_backspace(self):
+        entered = []
+        editor = LineEditor("CAST", lambda text: entered.append(text))
+        editor = type_keys(editor, "31")
+        editor = editor.feed(127)
+        editor = type_keys(editor, "6")
+        self.assertEqual(editor.text, "36")
+        self.assertIsNone(editor.feed(10))
+        self.assertEqual(entered, ["36"])
+
+    def test_escape_cancels(self):
+        editor = LineEditor("CAST", lambda text: self.fail("entered"))
+        self.assertIsNone(type_keys(editor, "3").feed(27))
+
+    def test_odometer_calibrate_asks_again(self):
+        link = RecordingLink()
+        undo = []
+        editor = LineEditor("Odometer", odometer_command, link, undo)
+        editor = type_keys(editor, "c\n")
+        self.assertEqual(editor.title, "Enter expected odometer")
+        self.assertIsNone(type_keys(editor, "1.5\n"))
+        type_keys(LineEditor("Odometer", odometer_command, link, undo), "d\n")
+        self.assertEqual(link.sent, [("calibrate", 1.5), ("mode", OdometerMode.DRIVE)])
+        # Only the calibration can be undone
+        self.assertEqual(undo, [None])
+
+
+class TestEnterInstruction(unittest.TestCase):
+    def setUp(self):
+        self.config = Config("config.yaml")
+        self.config.conf["auto_advance"] = True
+        self.config.conf["units"] = "km"
+
+    def test_complete_instruction_is_queued(self):
+        link = RecordingLink(advance_seq=4)
+        instruction = Instruction(speed_kmh=50)
+        enter_instruction(link, self.config, instruction, 4, "d", "1.5")
+        self.assertEqual(link.sent, [("queue", instruction, 4)])
+
+    def test_edit_after_the_computer_started_it_is_refused(self):
+        link = RecordingLink(advance_seq=5)
+        instruction = Instruction(speed_kmh=50, distance_km=1)
+        with self.assertRaises(ValueError):
+            enter_instruction(link, self.config, instruction, 4, "d", "1.5")
+        self.assertEqual(instruction.get_distance(), 1)
+        self.assertEqual(link.sent, [])
+
+
+class TestUndoHistory(unittest.TestCase):
+    def test_reverted_start_gives_next_instruction_back(self):
+        link = RecordingLink()
+        undo = UndoHistory(10)
+        instruction = Instruction(speed_kmh=50, distance_km=1)
+        undo.append(instruction)
+        undo.send(link)
+        self.assertEqual(link.sent, [("undo",)])
+        # Not handled yet
+        self.assertIsNone(undo.restored(link.state))
+        reverted = SimpleNamespace(instruction_seq=2, message_seq=1)
+        self.assertIs(undo.restored(reverted), instruction)
+        self.assertIsNone(undo.restored(reverted))
+
+    def test_start_kept_by_the_computer_stays_started(self):
+        link = RecordingLink()
+        undo = UndoHistory(10)
+        undo.append(Instruction(speed_kmh=50, distance_km=1))
+        undo.send(link)
+        # An instruction had started by itself since, so nothing went back
+        kept = SimpleNamespace(instruction_seq=3, message_seq=1)
+        self.assertIsNone(undo.restored(kept))
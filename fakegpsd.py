@@ -0,0 +1,327 @@
+import argparse
+import itertools
+import json
+import random
+import selectors
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from fusion import FusionSource
+from rallycomp import GpsdSource, RallyComputer
+from simulate import SyntheticTrack, format_gps_time
+
+
+def load_track(filename: str) -> list:
+    """Reads the TPV reports with a fix from a `gpspipe -w` log"""
+    reports = []
+    for line in Path(filename).read_text().splitlines():
+        if not line.startswith("{"):
+            continue
+        report = json.loads(line)
+        if report.get("class") == "TPV" and report.get("mode", 0) >= 2:
+            reports.append(report)
+    if not reports:
+        raise ValueError("No TPV fixes in " + filename)
+    return reports
+
+
+class GpsdHandler(socketserver.StreamRequestHandler):
+    """Speaks enough of the gpsd JSON protocol for gpsd-py3 and GpsdSource"""
+
+    def handle(self):
+        fake = self.server.fake
+        self.send(
+            {
+                "class": "VERSION",
+                "release": "3.17",
+                "rev": "fakegpsd",
+                "proto_major": 3,
+                "proto_minor": 12,
+            }
+        )
+        for line in self.rfile:
+            command = line.decode().strip().rstrip(";")
+            if command.startswith("?WATCH"):
+                watch = {"enable": True}
+                if "=" in command:
+                    watch.update(json.loads(command.split("=", 1)[1]))
+                self.send({"class": "DEVICES", "devices": [fake.device]})
+                self.send(dict({"class": "WATCH"}, **watch))
+                if watch.get("enable") and watch.get("json"):
+                    fake.subscribe(self)
+                else:
+                    fake.unsubscribe(self)
+            elif command == "?POLL":
+                self.send(fake.poll())
+        fake.unsubscribe(self)
+
+    def send(self, message: dict):
+        with self.server.fake.lock:
+            self.wfile.write(json.dumps(message).encode() + b"\n")
+
+
+class FakeGpsd:
+    """A local stand-in for gpsd that serves a track at a fixed rate.
+
+    Fixes are stamped with the wall clock when they are scheduled, so a
+    client on the same machine can measure its latency from the fix time.
+    The impairments are probabilities per fix, except jitter, which is the
+    longest extra delay in seconds before a fix is sent.
+    """
+
+    def __init__(
+        self,
+        reports=None,
+        rate_hz: float = 1,
+        host: str = "127.0.0.1",
+        port: int = 2947,
+        jitter: float = 0,
+        dropout: float = 0,
+        duplicate: float = 0,
+        mode_change: float = 0,
+        seed: Optional[int] = None,
+    ):
+        if reports is None:
+            track = SyntheticTrack(datetime.now(timezone.utc), rate_hz=rate_hz)
+            reports = iter(track.next_report, None)
+        self.reports = reports
+        self.interval = 1 / rate_hz
+        self.jitter = jitter
+        self.dropout = dropout
+        self.duplicate = duplicate
+        self.mode_change = mode_change
+        self.random = random.Random(seed)
+        self.device = {
+            "class": "DEVICE",
+            "path": "/dev/fake",
+            "driver": "fakegpsd",
+            "bps": 115200,
+        }
+        self.lock = threading.Lock()
+        self.watchers = set()
+        self.mode = 3
+        self.latest = {"class": "TPV", "mode": 1}
+        self.counters = {"sent": 0, "dropped": 0, "duplicated": 0, "no_fix": 0}
+        self.stopped = threading.Event()
+        self.server = socketserver.ThreadingTCPServer(
+            (host, port), GpsdHandler, bind_and_activate=False
+        )
+        self.server.allow_reuse_address = True
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.server.server_bind()
+        self.server.server_activate()
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self.feed, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def subscribe(self, handler: GpsdHandler):
+        with self.lock:
+            self.watchers.add(handler)
+
+    def unsubscribe(self, handler: GpsdHandler):
+        with self.lock:
+            self.watchers.discard(handler)
+
+    def poll(self) -> dict:
+        with self.lock:
+            return {
+                "class": "POLL",
+                "time": format_gps_time(datetime.now(timezone.utc)),
+                "active": 1,
+                "tpv": [self.latest],
+                "sky": [{"class": "SKY", "satellites": []}],
+            }
+
+    def feed(self):
+        next_fix = time.monotonic()
+        while not self.stopped.wait(max(next_fix - time.monotonic(), 0)):
+            next_fix = next_fix + self.interval
+            fix_time = datetime.now(timezone.utc)
+            report = self.impair(dict(next(self.reports)), fix_time)
+            if report is None:
+                continue
+            if self.jitter and self.stopped.wait(self.random.uniform(0, self.jitter)):
+                break
+            self.publish(report)
+
+    def impair(self, report: dict, fix_time: datetime) -> Optional[dict]:
+        if self.random.random() < self.dropout:
+            self.counters["dropped"] += 1
+            return None
+        if self.random.random() < self.mode_change:
+            self.mode = self.random.choice([m for m in (1, 2, 3) if m != self.mode])
+        report["mode"] = self.mode
+        report["time"] = format_gps_time(fix_time)
+        if self.mode < 3:
+            report.pop("alt", None)
+        if self.mode < 2:
+            self.counters["no_fix"] += 1
+            report.pop("lat", None)
+            report.pop("lon", None)
+        if self.latest.get("time") and self.random.random() < self.duplicate:
+            self.counters["duplicated"] += 1
+            report["time"] = self.latest["time"]
+        return report
+
+    def publish(self, report: dict):
+        line = json.dumps(report).encode() + b"\n"
+        with self.lock:
+            self.latest = report
+            self.counters["sent"] += 1
+            for watcher in list(self.watchers):
+                try:
+                    watcher.wfile.write(line)
+                except OSError:
+                    self.watchers.discard(watcher)
+
+
+def measure(
+    host: str, port: int, seconds: float, client: str, receivers: int = 1
+) -> dict:
+    """Drives the real RallyComputer client path against gpsd and times fixes.
+
+    Latency is the wall clock when the odometer takes a fix minus the fix
+    time, so it only makes sense against a gpsd on this machine. With more
+    than one receiver, they are on consecutive ports and merged by a
+    FusionSource.
+    """
+    if receivers > 1:
+        source = FusionSource(
+            {
+                "{}:{}".format(host, p): GpsdSource(host, p)
+                for p in range(port, port + receivers)
+            }
+        )
+    else:
+        source = GpsdSource(host, port)
+    rcomp = RallyComputer(source)
+    latencies = []
+    errors = 0
+    start = time.monotonic()
+    if client == "watch":
+        source.watch()
+        selector = selectors.DefaultSelector()
+        selector.register(source, selectors.EVENT_READ)
+        while time.monotonic() - start < seconds:
+            timeout = source.timeout()
+            if not selector.select(seconds if timeout is None else timeout):
+                if timeout is None:
+                    continue
+            try:
+                if rcomp.receive_update():
+                    latencies.append(fix_latency(rcomp))
+            except Exception:
+                errors += 1
+    else:
+        while time.monotonic() - start < seconds:
+            try:
+                rcomp.update()
+                latencies.append(fix_latency(rcomp))
+            except Exception:
+                errors += 1
+                time.sleep(0.05)
+    elapsed = time.monotonic() - start
+    source.close()
+    latencies.sort()
+    result = {
+        "fixes": rcomp.fix_count,
+        "fixes_per_second": rcomp.fix_count / elapsed,
+        "errors": errors,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+        "filters": rcomp.filters.stats(),
+    }
+    if receivers > 1:
+        result["sources"] = source.stats()
+    return result
+
+
+def fix_latency(rcomp: RallyComputer) -> float:
+    return (datetime.now(timezone.utc) - rcomp.odo.lastFix.timestamp).total_seconds()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Serve a fake gpsd for testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2947)
+    parser.add_argument("--rate", type=float, default=1, help="fixes per second")
+    parser.add_argument("--track", help="gpspipe -w log to replay, in a loop")
+    parser.add_argument("--jitter", type=float, default=0, help="max delay, s")
+    parser.add_argument("--dropout", type=float, default=0)
+    parser.add_argument("--duplicate", type=float, default=0)
+    parser.add_argument("--mode-change", type=float, default=0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--measure",
+        type=float,
+        metavar="SECONDS",
+        help="run RallyComputer against the fake for this long and report",
+    )
+    parser.add_argument("--client", choices=["watch", "poll"], default="watch")
+    parser.add_argument(
+        "--receivers",
+        type=int,
+        default=1,
+        help="serve this many receivers, on consecutive ports",
+    )
+    args = parser.parse_args(argv)
+
+    track = None
+    if args.track:
+        track = load_track(args.track)
+    fakes = []
+    for index in range(args.receivers):
+        reports = None
+        if track:
+            reports = itertools.cycle(track)
+        seed = None if args.seed is None else args.seed + index
+        fake = FakeGpsd(
+            reports,
+            rate_hz=args.rate,
+            host=args.host,
+            port=args.port + index,
+            jitter=args.jitter,
+            dropout=args.dropout,
+            duplicate=args.duplicate,
+            mode_change=args.mode_change,
+            seed=seed,
+        )
+        fakes.append(fake.start())
+    try:
+        if args.measure:
+            result = measure(
+                args.host, args.port, args.measure, args.client, args.receivers
+            )
+            result["servers"] = [fake.counters for fake in fakes]
+            print(json.dumps(result, indent=2))
+        else:
+            for fake in fakes:
+                print("Serving fake gpsd on {}:{}".format(args.host, fake.port))
+            fakes[0].stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for fake in fakes:
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,44 @@
+import selectors
+import unittest
+from fakegpsd import FakeGpsd
+from rallycomp import GpsdSource, OdometerMode, RallyComputer
+
+
+class TestFakeGpsd(unittest.TestCase):
+    def connect(self, **kwargs):
+        fake = FakeGpsd(rate_hz=50, port=0, **kwargs).start()
+        self.addCleanup(fake.stop)
+        source = GpsdSource(port=fake.port)
+        rcomp = RallyComputer(source)
+        self.addCleanup(source.close)
+        return fake, source, rcomp
+
+    def receive(self, source, rcomp, count):
+        selector = selectors.DefaultSelector()
+        selector.register(source, selectors.EVENT_READ)
+        new_fixes = 0
+        for _ in range(count):
+            self.assertTrue(selector.select(1))
+            if rcomp.receive_update():
+                new_fixes += 1
+        return new_fixes
+
+    def test_poll(self):
+        fake, source, rcomp = self.connect()
+        rcomp.odo.mode = OdometerMode.DRIVE
+        rcomp.update()
+        rcomp.update()
+        self.assertEqual(rcomp.fix_count, 2)
+        self.assertGreater(rcomp.odo.distanceAccumulator, 0)
+
+    def test_watch(self):
+        fake, source, rcomp = self.connect()
+        source.watch()
+        self.assertGreater(self.receive(source, rcomp, 10), 0)
+        self.assertGreaterEqual(rcomp.fix_count, 1)
+
+    def test_duplicate_timestamps_are_not_new_fixes(self):
+        fake, source, rcomp = self.connect(duplicate=1)
+        source.watch()
+        self.assertEqual(self.receive(source, rcomp, 5), 0)
+        self.assertGreater(fake.counters["duplicated"], 0)
@@ -0,0 +1,231 @@
+import copy
+import math
+import time
+
+METERS_PER_DEGREE = 6371000 * math.pi / 180
+
+
+def moved_to(fix, lat: float, lon: float, alt: float):
+    """Returns a copy of a FourDPosition at another position, keeping its time"""
+    moved = copy.copy(fix)
+    moved.lat = lat
+    moved.lon = lon
+    moved.alt = alt
+    return moved
+
+
+class FilterStage:
+    """One step of a FilterPipeline.
+
+    Subclasses implement filter(), which returns the fix to pass on (possibly
+    altered) or None to drop it, in constant time. process() keeps the
+    counters.
+    """
+
+    name = "stage"
+
+    def __init__(self):
+        self.seen = 0
+        self.rejected = 0
+        self.nanoseconds = 0
+
+    def process(self, fix):
+        start = time.perf_counter_ns()
+        result = self.filter(fix)
+        self.nanoseconds += time.perf_counter_ns() - start
+        self.seen += 1
+        if result is None:
+            self.rejected += 1
+        return result
+
+    def filter(self, fix):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {
+            "stage": self.name,
+            "seen": self.seen,
+            "rejected": self.rejected,
+            "mean_us": self.nanoseconds / self.seen / 1000 if self.seen else 0,
+        }
+
+
+class QualityGate(FilterStage):
+    """Drops fixes below min_mode or with a larger reported horizontal error.
+
+    gpsd doesn't put HDOP in its TPV reports, so this gates on its 95%
+    horizontal error estimate instead; 0 means it wasn't reported. 2D fixes
+    carry no altitude, so they are given the last 3D altitude rather than
+    jumping to 0.
+    """
+
+    name = "quality"
+
+    def __init__(self, min_mode: int = 2, max_error: float = 50):
+        super().__init__()
+        self.min_mode = min_mode
+        self.max_error = max_error
+        self.last_alt = None
+
+    def filter(self, fix):
+        if fix.mode < self.min_mode or fix.error > self.max_error:
+            return None
+        if fix.mode >= 3:
+            self.last_alt = fix.alt
+        elif self.last_alt is not None:
+            fix = moved_to(fix, fix.lat, fix.lon, self.last_alt)
+        return fix
+
+
+class SpeedGate(FilterStage):
+    """Drops fixes that imply an impossible speed since the last one passed"""
+
+    name = "speed"
+
+    def __init__(self, max_speed_kmh: float = 250):
+        super().__init__()
+        self.max_speed = max_speed_kmh / 3.6  # meters per second
+        self.last = None
+
+    def filter(self, fix):
+        if self.last is not None:
+            displacement = fix.subtract(self.last)
+            seconds = displacement.time.total_seconds()
+            if seconds <= 0 or displacement.distance > self.max_speed * seconds:
+                return None
+        self.last = fix
+        return fix
+
+
+class StationaryGate(FilterStage):
+    """Holds the position still while the receiver reports the car stopped.
+
+    Parked fixes wander by a few meters, which an odometer in Drive would
+    count. Slow fixes keep their time but take the last moving position.
+    Fixes without a reported speed pass unchanged.
+    """
+
+    name = "stationary"
+
+    def __init__(self, min_speed_kmh: float = 1):
+        super().__init__()
+        self.min_speed = min_speed_kmh
+        self.last = None
+
+    def filter(self, fix):
+        if not fix.speed_known:
+            return fix
+        if self.last is not None and fix.speed < self.min_speed:
+            return moved_to(fix, self.last.lat, self.last.lon, self.last.alt)
+        self.last = fix
+        return fix
+
+
+class KalmanAxis:
+    """Constant-velocity Kalman filter along one axis, in meters"""
+
+    def __init__(self, position: float, variance: float):
+        self.position = position
+        self.velocity = 0.0
+        self.p00 = variance
+        self.p01 = 0.0
+        self.p11 = 100.0  # (10 m/s)^2, nothing is known about speed yet
+
+    def update(self, measured: float, variance: float, dt: float, noise: float):
+        # Predict
+        self.position = self.position + self.velocity * dt
+        self.p00 = self.p00 + dt * (2 * self.p01 + dt * self.p11) + noise * dt**3 / 3
+        self.p01 = self.p01 + dt * self.p11 + noise * dt**2 / 2
+        self.p11 = self.p11 + noise * dt
+        # Correct
+        s = self.p00 + variance
+        k0 = self.p00 / s
+        k1 = self.p01 / s
+        residual = measured - self.position
+        self.position = self.position + k0 * residual
+        self.velocity = self.velocity + k1 * residual
+        self.p11 = self.p11 - k1 * self.p01
+        self.p00 = (1 - k0) * self.p00
+        self.p01 = (1 - k0) * self.p01
+        return self.position
+
+
+class KalmanSmoother(FilterStage):
+    """Smooths position with a constant-velocity Kalman filter per axis.
+
+    Positions are filtered in meters north and east of the first fix. The
+    measurement variance comes from the fix's 95% error when it has one.
+    """
+
+    name = "kalman"
+
+    def __init__(self, accuracy: float = 5, acceleration: float = 1):
+        super().__init__()
+        self.variance = accuracy**2
+        self.noise = acceleration**2
+        self.last = None
+        self.origin = None
+        self.east_scale = None
+        self.north = None
+        self.east = None
+        self.up = None
+
+    def filter(self, fix):
+        variance = (fix.error / 2) ** 2 if fix.error else self.variance
+        if self.last is None:
+            self.origin = (fix.lat, fix.lon)
+            self.east_scale = METERS_PER_DEGREE * math.cos(math.radians(fix.lat))
+            self.north = KalmanAxis(0, variance)
+            self.east = KalmanAxis(0, variance)
+            self.up = KalmanAxis(fix.alt, variance)
+            self.last = fix
+            return fix
+        dt = (fix.timestamp - self.last.timestamp).total_seconds()
+        self.last = fix
+        north = self.north.update(
+            (fix.lat - self.origin[0]) * METERS_PER_DEGREE, variance, dt, self.noise
+        )
+        east = self.east.update(
+            (fix.lon - self.origin[1]) * self.east_scale, variance, dt, self.noise
+        )
+        up = self.up.update(fix.alt, variance, dt, self.noise)
+        return moved_to(
+            fix,
+            self.origin[0] + north / METERS_PER_DEGREE,
+            self.origin[1] + east / self.east_scale,
+            up,
+        )
+
+
+class FilterPipeline:
+    """Runs each fix through the stages in order, stopping at a rejection"""
+
+    def __init__(self, stages: list):
+        self.stages = stages
+
+    def process(self, fix):
+        for stage in self.stages:
+            fix = stage.process(fix)
+            if fix is None:
+                return None
+        return fix
+
+    def stats(self) -> list:
+        return [stage.stats() for stage in self.stages]
+
+
+def build_pipeline(settings: dict) -> FilterPipeline:
+    """Builds the pipeline from the filters section of config.yaml"""
+    stages = [
+        QualityGate(settings.get("min_mode", 2), settings.get("max_error_m", 50)),
+        SpeedGate(settings.get("max_speed_kmh", 250)),
+        StationaryGate(settings.get("stationary_kmh", 1)),
+    ]
+    if settings.get("kalman", False):
+        stages.append(
+            KalmanSmoother(
+                settings.get("kalman_accuracy_m", 5),
+                settings.get("kalman_acceleration", 1),
+            )
+        )
+    return FilterPipeline(stages)
@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime, timedelta
+from filters import (
+    KalmanSmoother,
+    QualityGate,
+    SpeedGate,
+    StationaryGate,
+    build_pipeline,
+)
+from rallycomp import FourDPosition
+
+START = datetime(2020, 1, 1, 0, 0, 0)
+
+
+def fix(seconds, lat, speed=40, alt=150, mode=3, error=0):
+    return FourDPosition(
+        (lat, -122.0),
+        alt,
+        START + timedelta(seconds=seconds),
+        speed or 0,
+        mode=mode,
+        error=error,
+        speed_known=speed is not None,
+    )
+
+
+class TestFilters(unittest.TestCase):
+    def test_quality_gate(self):
+        gate = QualityGate(min_mode=2, max_error=20)
+        self.assertIsNotNone(gate.process(fix(0, 47.0)))
+        self.assertIsNone(gate.process(fix(1, 47.0, mode=1)))
+        self.assertIsNone(gate.process(fix(2, 47.0, error=30)))
+        two_d = gate.process(fix(3, 47.0, alt=0, mode=2))
+        self.assertEqual(two_d.alt, 150)
+        self.assertEqual((gate.seen, gate.rejected), (4, 2))
+
+    def test_speed_gate_drops_spike(self):
+        gate = SpeedGate(max_speed_kmh=100)
+        gate.process(fix(0, 47.0))
+        self.assertIsNone(gate.process(fix(1, 47.01)))  # ~1.1 km in a second
+        self.assertIsNotNone(gate.process(fix(2, 47.0002)))
+
+    def test_stationary_gate_pins_position(self):
+        gate = StationaryGate(min_speed_kmh=1)
+        gate.process(fix(0, 47.0))
+        parked = gate.process(fix(1, 47.00002, speed=0.2))
+        self.assertEqual(parked.lat, 47.0)
+        self.assertEqual(parked.timestamp, START + timedelta(seconds=1))
+
+    def test_stationary_gate_passes_fixes_without_speed(self):
+        gate = StationaryGate(min_speed_kmh=1)
+        gate.process(fix(0, 47.0))
+        moving = gate.process(fix(1, 47.0001, speed=None))
+        self.assertEqual(moving.lat, 47.0001)
+
+    def test_kalman_tracks_constant_velocity(self):
+        smoother = KalmanSmoother(accuracy=5)
+        for second in range(60):
+            smoothed = smoother.process(fix(second, 47.0 + second * 0.0001))
+        self.assertAlmostEqual(smoothed.lat, 47.0059, places=5)
+
+    def test_pipeline_stops_at_rejection(self):
+        pipeline = build_pipeline({"kalman": True})
+        pipeline.process(fix(0, 47.0))
+        self.assertIsNone(pipeline.process(fix(1, 47.0, mode=1)))
+        stats = pipeline.stats()
+        self.assertEqual([s["stage"] for s in stats][:2], ["quality", "speed"])
+        self.assertEqual(stats[0]["rejected"], 1)
+        self.assertEqual(stats[1]["seen"], 1)
@@ -0,0 +1,249 @@
+import copy
+import heapq
+import math
+import selectors
+import time
+from datetime import timezone
+
+
+class Feed:
+    """One receiver of a FusionSource, with its counters"""
+
+    def __init__(self, name: str, source):
+        self.name = name
+        self.source = source
+        self.alive = True
+        self.latest = None  # time of the newest fix it has sent
+        self.interval = None  # seconds between its last two fixes
+        self.next_due = None  # fix time its next fix is expected at
+        self.arrived = None  # clock reading when its newest fix arrived
+        self.last_packet = None
+        self.counters = {
+            "received": 0,
+            "used": 0,
+            "fused": 0,
+            "duplicates": 0,
+            "late": 0,
+            "no_fix": 0,
+            "errors": 0,
+        }
+
+    def stats(self) -> dict:
+        return dict({"source": self.name, "alive": self.alive}, **self.counters)
+
+
+def fix_error(packet, default_error: float) -> float:
+    """The fix's 95% horizontal error in meters, or default_error if unknown"""
+    return max(packet.error.get("x", 0), packet.error.get("y", 0)) or default_error
+
+
+def fuse(packets: list, default_error: float):
+    """Combines fixes of the same epoch, weighting each by its reported accuracy.
+
+    Weights are inverse variances, so a receiver reporting half the error
+    counts four times as much. Altitude only comes from 3D fixes, and speed
+    from fixes that report one.
+    """
+    if len(packets) == 1:
+        return packets[0]
+    weights = [fix_error(packet, default_error) ** -2 for packet in packets]
+    total = sum(weights)
+    best = max(range(len(packets)), key=lambda index: weights[index])
+    fused = copy.copy(packets[best])
+    fused.lat = sum(w * p.lat for w, p in zip(weights, packets)) / total
+    fused.lon = sum(w * p.lon for w, p in zip(weights, packets)) / total
+    with_speed = [(w, p) for w, p in zip(weights, packets) if p.hspeed is not None]
+    if with_speed:
+        fused.hspeed = sum(w * p.hspeed for w, p in with_speed) / sum(
+            w for w, _ in with_speed
+        )
+    with_alt = [(w, p) for w, p in zip(weights, packets) if p.mode >= 3]
+    if with_alt:
+        fused.alt = sum(w * p.alt for w, p in with_alt) / sum(w for w, _ in with_alt)
+    fused.mode = max(packet.mode for packet in packets)
+    error = 1 / math.sqrt(total)
+    fused.error = dict(fused.error, x=error, y=error)
+    return fused
+
+
+class FusionSource:
+    """RallyComputer fix source that merges several receivers into one stream.
+
+    Fixes from every receiver go into one heap ordered by fix time. A fix is
+    held while a live receiver could still send one as old: one that is
+    behind it and whose next fix is due no later, going by the time between
+    its last two fixes. Fixes of the same epoch are fused into one.
+
+    A fix is held for at most wait fix intervals after it arrived, and a
+    receiver that has sent nothing for longer than one interval plus that is
+    not waited for at all, so a receiver going quiet costs one short delay.
+    The fix interval is the shortest of any receiver's. One whose connection
+    fails is dropped.
+
+    fileno() is the internal selector's, which is readable whenever any
+    receiver is; timeout() says when a held fix is due regardless.
+    """
+
+    def __init__(
+        self,
+        sources: dict,
+        wait: float = 0.25,
+        default_error: float = 10,
+        clock=time.monotonic,
+    ):
+        self.feeds = [Feed(name, source) for name, source in sources.items()]
+        self.wait = wait
+        self.default_error = default_error
+        self.clock = clock
+        self.heap = []
+        self.order = 0  # keeps the heap stable for fixes of the same time
+        self.emitted = None
+        self.selector = selectors.DefaultSelector()
+        self.watching = False
+
+    def live_feeds(self) -> list:
+        return [feed for feed in self.feeds if feed.alive]
+
+    def connect(self):
+        for feed in self.feeds:
+            try:
+                feed.source.connect()
+            except OSError:
+                feed.counters["errors"] += 1
+                feed.alive = False
+        if not self.live_feeds():
+            raise ConnectionError("No receiver could be reached")
+
+    def get_current(self):
+        """Polls every live receiver; returns the most accurate fix"""
+        best = None
+        for feed in self.live_feeds():
+            try:
+                packet = feed.source.get_current()
+            except (OSError, ValueError):
+                feed.counters["errors"] += 1
+                continue
+            if best is None or best.mode < 2:
+                best = packet
+            elif packet.mode >= 2:
+                error = fix_error(packet, self.default_error)
+                if error < fix_error(best, self.default_error):
+                    best = packet
+        if best is None:
+            raise ConnectionError("No receiver answered")
+        return best
+
+    def watch(self):
+        for feed in self.live_feeds():
+            feed.source.watch()
+            self.selector.register(feed.source, selectors.EVENT_READ, feed)
+        self.watching = True
+
+    def fileno(self) -> int:
+        return self.selector.fileno()
+
+    def interval(self) -> float:
+        """Seconds between fixes, from the fastest live receiver; 1 if unknown"""
+        intervals = [feed.interval for feed in self.live_feeds() if feed.interval]
+        return min(intervals, default=1.0)
+
+    def timeout(self):
+        """Seconds until the oldest held fix is released, or None if none is held"""
+        if not self.heap:
+            return None
+        deadline = self.heap[0][2] + self.wait * self.interval()
+        return max(deadline - self.clock(), 0.0)
+
+    def close(self):
+        self.selector.close()
+        for feed in self.live_feeds():
+            feed.source.close()
+
+    def drop(self, feed: Feed):
+        feed.alive = False
+        if self.watching:
+            self.selector.unregister(feed.source)
+        try:
+            feed.source.close()
+        except OSError:
+            pass
+
+    def receive(self) -> list:
+        """Reads the receivers that have data; returns the fixes now in order"""
+        for key, _ in self.selector.select(0):
+            self.read_feed(key.data)
+        if not self.live_feeds():
+            raise ConnectionError("Every receiver has failed")
+        fixes = self.release()
+        if not fixes:
+            # Only pass on a lost fix when no receiver has one
+            last = [feed.last_packet for feed in self.live_feeds()]
+            if all(packet is not None and packet.mode < 2 for packet in last):
+                return last[-1:]
+        return fixes
+
+    def read_feed(self, feed: Feed):
+        try:
+            packets = feed.source.receive()
+        except (OSError, ValueError):
+            feed.counters["errors"] += 1
+            self.drop(feed)
+            return
+        for packet in packets:
+            feed.counters["received"] += 1
+            feed.last_packet = packet
+            if packet.mode < 2:
+                feed.counters["no_fix"] += 1
+                continue
+            fix_time = packet.get_time().replace(tzinfo=timezone.utc)
+            arrived = self.clock()
+            if feed.latest is None or fix_time > feed.latest:
+                if feed.latest is not None:
+                    gap = fix_time - feed.latest
+                    feed.interval = gap.total_seconds()
+                    feed.next_due = fix_time + gap
+                feed.latest = fix_time
+                feed.arrived = arrived
+            if self.emitted is not None and fix_time <= self.emitted:
+                feed.counters["late"] += 1
+                continue
+            heapq.heappush(self.heap, (fix_time, self.order, arrived, feed, packet))
+            self.order += 1
+
+    def complete(self, fix_time, now: float) -> bool:
+        """True if no live receiver is still waited for a fix as old as fix_time"""
+        quiet = (1 + self.wait) * self.interval()
+        for feed in self.live_feeds():
+            if feed.latest is None or feed.latest >= fix_time:
+                continue
+            if feed.next_due is not None and feed.next_due > fix_time:
+                continue
+            if now - feed.arrived <= quiet:
+                return False
+        return True
+
+    def release(self) -> list:
+        fixes = []
+        now = self.clock()
+        held = self.wait * self.interval()
+        while self.heap and (
+            self.complete(self.heap[0][0], now) or now - self.heap[0][2] >= held
+        ):
+            fix_time = self.heap[0][0]
+            epoch = {}
+            while self.heap and self.heap[0][0] == fix_time:
+                _, _, _, feed, packet = heapq.heappop(self.heap)
+                if feed in epoch:
+                    feed.counters["duplicates"] += 1
+                    continue
+                epoch[feed] = packet
+            for feed in epoch:
+                feed.counters["used"] += 1
+                if len(epoch) > 1:
+                    feed.counters["fused"] += 1
+            fixes.append(fuse(list(epoch.values()), self.default_error))
+            self.emitted = fix_time
+        return fixes
+
+    def stats(self) -> list:
+        return [feed.stats() for feed in self.feeds]
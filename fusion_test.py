@@ -0,0 +1,141 @@
+import unittest
+from fusion import FusionSource
+from rallycomp import OdometerMode, RallyComputer
+from rallycomp_test import make_packet
+
+
+class QueueSource:
+    """A receiver whose batches of fixes are handed out by the test"""
+
+    def __init__(self, first):
+        self.first = first
+        self.batches = []
+
+    def connect(self):
+        pass
+
+    def get_current(self):
+        return self.first
+
+    def receive(self):
+        batch = self.batches.pop(0)
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def close(self):
+        pass
+
+
+def fix(second, lat=47.0, error=0, mode=3):
+    packet = make_packet(
+        lat, -122.0, "2020-01-01T00:00:{:06.3f}Z".format(second), speed=11
+    )
+    packet.mode = mode
+    packet.error = {"x": error, "y": error}
+    return packet
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFusionSource(unittest.TestCase):
+    def setUp(self):
+        self.a = QueueSource(fix(0))
+        self.b = QueueSource(fix(0))
+        self.clock = Clock()
+        self.fusion = FusionSource(
+            {"a": self.a, "b": self.b}, wait=0.25, clock=self.clock
+        )
+        self.a.batches.append([fix(0)])
+        self.b.batches.append([fix(0)])
+        for feed in self.fusion.feeds:
+            self.fusion.read_feed(feed)
+        self.fusion.release()
+
+    def feed(self, source, *packets):
+        source.batches.append(list(packets))
+        self.fusion.read_feed(self.fusion.feeds[0 if source is self.a else 1])
+        return self.fusion.release()
+
+    def times(self, packets):
+        return [packet.time for packet in packets]
+
+    def test_merges_in_time_order(self):
+        # b has sent one fix, so nothing says when its next is due
+        self.assertEqual(self.feed(self.a, fix(1.0), fix(1.2)), [])
+        released = self.feed(self.b, fix(1.1))
+        self.assertEqual(
+            self.times(released),
+            [
+                "2020-01-01T00:00:01.000Z",
+                "2020-01-01T00:00:01.100Z",
+                "2020-01-01T00:00:01.200Z",
+            ],
+        )
+        # Neither receiver's next fix is due before these, so none waits
+        released = self.feed(self.a, fix(2.0))
+        self.assertEqual(self.times(released), ["2020-01-01T00:00:02.000Z"])
+        released = self.feed(self.b, fix(2.1))
+        self.assertEqual(self.times(released), ["2020-01-01T00:00:02.100Z"])
+        self.assertIsNone(self.fusion.timeout())
+
+    def test_same_epoch_is_fused_by_accuracy(self):
+        self.feed(self.a, fix(1, lat=47.0, error=2))
+        released = self.feed(self.b, fix(1, lat=47.0003, error=4))
+        self.assertEqual(len(released), 1)
+        self.assertAlmostEqual(released[0].lat, 47.00006)
+        self.assertAlmostEqual(released[0].error["x"], (1 / (1 / 4 + 1 / 16)) ** 0.5)
+        stats = self.fusion.stats()
+        self.assertEqual([feed["fused"] for feed in stats], [2, 2])
+
+    def test_fails_over_when_a_receiver_goes_quiet(self):
+        self.clock.now = 1.0
+        self.feed(self.a, fix(1))
+        self.clock.now = 1.01
+        self.feed(self.b, fix(1))
+        self.clock.now = 2.0
+        self.assertEqual(self.feed(self.a, fix(2)), [])
+        # b may only hold it a quarter of a fix interval
+        self.assertAlmostEqual(self.fusion.timeout(), 0.25)
+        self.clock.now = 2.25
+        self.assertEqual(self.fusion.timeout(), 0)
+        released = self.fusion.release()
+        self.assertEqual(self.times(released), ["2020-01-01T00:00:02.000Z"])
+        self.assertIsNone(self.fusion.timeout())
+        # b has been quiet longer than an interval, so it isn't waited for
+        self.clock.now = 3.0
+        self.assertEqual(len(self.feed(self.a, fix(3))), 1)
+        # b comes back; its old fix is late, and it is waited for again
+        self.clock.now = 3.1
+        self.feed(self.b, fix(2.5))
+        self.assertEqual(self.fusion.feeds[1].counters["late"], 1)
+        self.clock.now = 4.0
+        self.assertEqual(self.feed(self.a, fix(4)), [])
+        self.assertEqual(len(self.feed(self.b, fix(4))), 1)
+
+    def test_drops_a_failed_connection(self):
+        self.feed(self.a, fix(1))
+        self.feed(self.b, fix(1))
+        self.b.batches.append(ConnectionError("gpsd closed the connection"))
+        self.fusion.read_feed(self.fusion.feeds[1])
+        self.assertFalse(self.fusion.feeds[1].alive)
+        self.assertEqual(len(self.feed(self.a, fix(2))), 1)
+
+    def test_drives_the_odometer(self):
+        rcomp = RallyComputer(self.fusion)
+        rcomp.odo.mode = OdometerMode.DRIVE
+        for source, packet in [
+            (self.a, fix(1, lat=47.0001)),
+            (self.b, fix(1.5, lat=47.00015)),
+            (self.a, fix(2, lat=47.0002)),
+        ]:
+            for released in self.feed(source, packet):
+                rcomp.add_packet(released)
+        self.assertEqual(rcomp.fix_count, 3)
+        self.assertAlmostEqual(rcomp.odo.distanceAccumulator, 22.239, 3)
@@ -0,0 +1,128 @@
+import argparse
+import json
+import math
+import sys
+from pathlib import Path
+
+
+class RunningStats:
+    """Count, mean, variance, min and max of a stream in constant memory.
+
+    The mean and variance are updated with Welford's method, which stays
+    accurate where summing squares would cancel.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def variance(self) -> float:
+        """Sample variance; 0 until there are two values"""
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+
+class LegStats:
+    """Running aggregates of one instruction, fed once per fix.
+
+    Only the aggregates are kept, never the fixes. Time outside ±1 s counts
+    the time since the previous fix whenever a fix is outside. Distance is
+    what the car moved, calibrated, whichever way the odometer counted it.
+    """
+
+    def __init__(self, number: int, instruction):
+        self.number = number
+        self.odometer = instruction.odometer
+        self.cast = instruction.get_speed()
+        self.start_time = instruction.start_time
+        self.last_time = instruction.start_time
+        self.offset = RunningStats()
+        self.outside_seconds = 0.0
+        self.distance = {}  # meters, by OdometerMode name
+
+    def add(self, offset: float, fix_time, moved: float, mode):
+        seconds = (fix_time - self.last_time).total_seconds()
+        self.last_time = fix_time
+        self.offset.add(offset)
+        if abs(offset) > 1:
+            self.outside_seconds += seconds
+        self.add_distance(moved, mode)
+
+    def add_distance(self, moved: float, mode):
+        self.distance[mode.name] = self.distance.get(mode.name, 0.0) + moved
+
+    def report(self, end_time=None) -> dict:
+        """Summarizes the leg, which ended at end_time or else the last fix"""
+        if end_time is None:
+            end_time = self.last_time
+        empty = self.offset.count == 0
+        return {
+            "instruction": self.number,
+            "cast_kmh": self.cast,
+            "calibration": self.odometer.calibration,
+            "start": self.start_time.isoformat(),
+            "end": end_time.isoformat(),
+            "seconds": (end_time - self.start_time).total_seconds(),
+            "fixes": self.offset.count,
+            "offset_mean_s": self.offset.mean,
+            "offset_sd_s": math.sqrt(self.offset.variance()),
+            "offset_min_s": 0.0 if empty else self.offset.minimum,
+            "offset_max_s": 0.0 if empty else self.offset.maximum,
+            "outside_1s_s": self.outside_seconds,
+            "distance_m": self.distance,
+        }
+
+
+def load_reports(filename: str) -> list:
+    return [json.loads(line) for line in Path(filename).read_text().splitlines()]
+
+
+def format_report(report: dict, config) -> str:
+    distances = " ".join(
+        "{} {:.3f}".format(mode[0], config.to_display_units(meters / 1000))
+        for mode, meters in sorted(report["distance_m"].items())
+    )
+    return "{:4d} {:7.2f} {:8.1f} {:6.2f} {:6.2f} {:6.2f} {:6.2f} {:7.1f}  {}".format(
+        report["instruction"],
+        config.to_display_units(report["cast_kmh"]),
+        report["seconds"],
+        report["offset_mean_s"],
+        report["offset_sd_s"],
+        report["offset_min_s"],
+        report["offset_max_s"],
+        report["outside_1s_s"],
+        distances,
+    )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Print the leg report")
+    parser.add_argument("log", nargs="?", help="leg log, default from config.yaml")
+    args = parser.parse_args(argv)
+
+    from rallycomp import Config  # rallycomp imports this module
+
+    config = Config("config.yaml")
+    print(
+        "   #    CAST     time   mean     sd    min    max  out 1s  distance ({})".format(
+            config.get_unit_name()
+        )
+    )
+    for report in load_reports(args.log or config.get_leg_log()):
+        print(format_report(report, config))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
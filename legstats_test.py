@@ -0,0 +1,39 @@
+import statistics
+import unittest
+from datetime import datetime, timedelta, timezone
+from legstats import LegStats, RunningStats
+from rallycomp import FourDPosition, Instruction, Odometer, OdometerMode
+
+
+class TestRunningStats(unittest.TestCase):
+    def test_matches_statistics(self):
+        values = [1e9 + 4, 1e9 + 7, 1e9 + 13, 1e9 + 16]
+        stats = RunningStats()
+        for value in values:
+            stats.add(value)
+        self.assertEqual(stats.count, 4)
+        self.assertAlmostEqual(stats.mean, statistics.mean(values))
+        self.assertAlmostEqual(stats.variance(), statistics.variance(values))
+        self.assertEqual((stats.minimum, stats.maximum), (1e9 + 4, 1e9 + 16))
+
+
+class TestLegStats(unittest.TestCase):
+    def test_report(self):
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        odo = Odometer(FourDPosition((47.0, -122.0), 150, start))
+        instruction = Instruction(speed_kmh=36, distance_km=1)
+        instruction.activate(odo)
+        leg = LegStats(3, instruction)
+        offsets = [0.5, 1.5, 2.0, -0.5]
+        modes = [OdometerMode.DRIVE] * 3 + [OdometerMode.PARK]
+        for second, (offset, mode) in enumerate(zip(offsets, modes), 1):
+            leg.add(offset, start + timedelta(seconds=second), 10, mode)
+        report = leg.report(start + timedelta(seconds=4.5))
+        self.assertEqual(report["instruction"], 3)
+        self.assertEqual(report["fixes"], 4)
+        self.assertEqual(report["seconds"], 4.5)
+        self.assertAlmostEqual(report["offset_mean_s"], 0.875)
+        self.assertEqual(report["offset_min_s"], -0.5)
+        self.assertEqual(report["offset_max_s"], 2.0)
+        self.assertEqual(report["outside_1s_s"], 2)
+        self.assertEqual(report["distance_m"], {"DRIVE": 30, "PARK": 10})
@@ -0,0 +1,140 @@
+import argparse
+import hashlib
+import json
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Tuple
+
+import yaml
+
+from rallycomp import Config
+
+
+def format_elapsed(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return "{}:{:02d}:{:04.1f}".format(hours, minutes, seconds)
+
+
+def compute_times(casts: list, end: float, step: float) -> array:
+    """Ideal elapsed seconds at every step from 0 to end, in one pass.
+
+    casts is a list of (start distance, CAST) pairs sorted by distance, in
+    the same unit (miles and mph, or km and km/h). The first starts at 0.
+    """
+    if not casts or casts[0][0] != 0:
+        raise ValueError("The first CAST must start at 0")
+    for _, cast in casts:
+        if cast <= 0:
+            raise ValueError("CAST must be positive")
+    steps = int(round(end / step)) + 1
+    times = array("d", bytes(8 * steps))
+    leg = 0
+    leg_start_time = 0.0
+    for i in range(steps):
+        distance = i * step
+        while leg + 1 < len(casts) and distance >= casts[leg + 1][0]:
+            leg_start_time += (casts[leg + 1][0] - casts[leg][0]) / casts[leg][1] * 3600
+            leg += 1
+        times[i] = leg_start_time + (distance - casts[leg][0]) / casts[leg][1] * 3600
+    return times
+
+
+class PaceTable:
+    """Ideal elapsed time at each step of distance from the regularity start"""
+
+    def __init__(self, step: float, times: array):
+        self.step = step
+        self.times = times
+
+    def row(self, distance: float) -> Tuple[float, float]:
+        """Returns (distance, ideal seconds) for the step nearest distance"""
+        index = min(max(int(round(distance / self.step)), 0), len(self.times) - 1)
+        return index * self.step, self.times[index]
+
+    def rows(self):
+        for index, seconds in enumerate(self.times):
+            yield index * self.step, seconds
+
+
+def load_route(filename: str) -> dict:
+    """Reads a route book: a name, an end distance and (start, CAST) pairs"""
+    route = yaml.safe_load(Path(filename).read_text())
+    route["casts"] = sorted(
+        (float(start), float(cast)) for start, cast in route["casts"]
+    )
+    return route
+
+
+def cached_table(
+    route: dict, units: str, cache_dir: str, step: float = 0.01
+) -> PaceTable:
+    """Returns the route's table, computing and saving it on first use.
+
+    Tables are keyed by the route name, units, step and every CAST, so
+    editing the route book computes a fresh table. A cached table of the
+    wrong length, left by an interrupted write, is computed again.
+    """
+    key = json.dumps([route.get("name", ""), units, step, route["end"], route["casts"]])
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    path = Path(cache_dir) / "{}-{}.pace".format(route.get("name", "route"), digest)
+    steps = int(round(route["end"] / step)) + 1
+    if path.exists():
+        data = path.read_bytes()
+        if len(data) == steps * array("d").itemsize:
+            times = array("d")
+            times.frombytes(data)
+            return PaceTable(step, times)
+    times = compute_times(route["casts"], route["end"], step)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write beside it and rename, so a reader never sees a partial table
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as out:
+        out.write(times.tobytes())
+    Path(out.name).replace(path)
+    return PaceTable(step, times)
+
+
+def load_pace_table(config: Config):
+    """Loads the table for the route book named in config.yaml, if any"""
+    filename = config.get_route_book()
+    if not filename:
+        return None
+    return cached_table(
+        load_route(filename), config.get_unit_name(), config.get_pace_table_cache()
+    )
+
+
+def parse_casts(text: str) -> list:
+    """Parses "0:30,2.35:36" into [(0.0, 30.0), (2.35, 36.0)]"""
+    casts = []
+    for leg in text.split(","):
+        start, cast = leg.split(":")
+        casts.append((float(start), float(cast)))
+    return sorted(casts)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Print a time-at-distance table")
+    parser.add_argument("route", nargs="?", help="route book YAML file")
+    parser.add_argument("--casts", help='legs as "start:cast,...", instead of a route')
+    parser.add_argument("--end", type=float, help="end distance with --casts")
+    parser.add_argument("--every", type=int, default=1, help="print every Nth step")
+    args = parser.parse_args(argv)
+
+    config = Config("config.yaml")
+    if args.route:
+        route = load_route(args.route)
+    elif args.casts and args.end:
+        route = {"name": "casts", "end": args.end, "casts": parse_casts(args.casts)}
+    else:
+        parser.error("give a route book, or --casts and --end")
+    table = cached_table(route, config.get_unit_name(), config.get_pace_table_cache())
+    for index, (distance, seconds) in enumerate(table.rows()):
+        if index % args.every == 0:
+            print("{:7.2f}  {}".format(distance, format_elapsed(seconds)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+from pathlib import Path
+from pacetable import cached_table, compute_times, format_elapsed, parse_casts
+
+
+class TestPaceTable(unittest.TestCase):
+    def test_two_casts(self):
+        times = compute_times([(0, 30), (1, 60)], 2, 0.01)
+        self.assertEqual(len(times), 201)
+        self.assertAlmostEqual(times[50], 60)  # half a mile at 30 mph
+        self.assertAlmostEqual(times[100], 120)
+        self.assertAlmostEqual(times[200], 180)  # then a mile at 60 mph
+
+    def test_cast_change_between_steps(self):
+        times = compute_times([(0, 30), (1.005, 60)], 2, 0.01)
+        self.assertAlmostEqual(times[100], 120)  # still at 30 mph
+        self.assertAlmostEqual(times[101], 120.6 + 0.005 * 60)
+
+    def test_cache_round_trip(self):
+        route = {"name": "test", "end": 1, "casts": parse_casts("0:36")}
+        with tempfile.TemporaryDirectory() as cache:
+            first = cached_table(route, "mi", cache)
+            second = cached_table(route, "mi", cache)
+            changed = cached_table(dict(route, casts=[(0.0, 72.0)]), "mi", cache)
+        self.assertEqual(first.times, second.times)
+        self.assertEqual(second.row(0.5), (0.5, 50))
+        self.assertEqual(changed.row(0.5), (0.5, 25))
+        self.assertEqual(second.row(5), (1.0, 100))
+
+    def test_first_cast_must_start_at_zero(self):
+        with self.assertRaises(ValueError):
+            compute_times([(0.5, 30), (1, 60)], 2, 0.01)
+
+    def test_truncated_cache_is_recomputed(self):
+        route = {"name": "test", "end": 1, "casts": parse_casts("0:36")}
+        with tempfile.TemporaryDirectory() as cache:
+            cached_table(route, "mi", cache)
+            (path,) = Path(cache).iterdir()
+            path.write_bytes(path.read_bytes()[:400])
+            table = cached_table(route, "mi", cache)
+            self.assertEqual(len(path.read_bytes()), 101 * 8)
+        self.assertEqual(len(table.times), 101)
+        self.assertEqual(table.row(1), (1.0, 100))
+
+    def test_format_elapsed(self):
+        self.assertEqual(format_elapsed(3725.25), "1:02:05.2")
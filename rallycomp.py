@@ -1,6 +1,9 @@
 from enum import Enum
 from pathlib import Path
+import collections
+import copy
 import gpsd
+import json
 import math
 import time
 from datetime import datetime, timedelta, timezone
@@ -8,6 +11,11 @@ from typing import Optional, Tuple
 
 import yaml
 
+from calibrate import FixLogWriter
+from filters import build_pipeline
+from fusion import FusionSource
+from legstats import LegStats
+
 
 class Units(Enum):
     MILES = 0
@@ -21,12 +29,18 @@ class FourDPosition:
         alt: float,
         timestamp: datetime,
         speed: float = 0,
+        mode: int = 3,
+        error: float = 0,
+        speed_known: bool = True,
     ):
         self.lat = position[0]
         self.lon = position[1]
         self.alt = alt
         self.timestamp = timestamp
         self.speed = speed
+        self.mode = mode
+        self.error = error  # horizontal, meters, 95% confidence; 0 if unknown
+        self.speed_known = speed_known  # False if the receiver sent no speed
 
     def distance_between_two_gps_points(self, lat1, lon1, lat2, lon2):
         R = 6371  # Radius of the earth in km
@@ -68,6 +82,7 @@ class Odometer:
     def __init__(self, origFix: FourDPosition, calibration: float = 1):
         self.origFix = origFix
         self.distanceAccumulator = 0
+        self.travelled = 0  # like distanceAccumulator, but never reset
         self.lastFix = origFix
         self.mode = OdometerMode.PARK
         self.calibration = calibration
@@ -80,14 +95,17 @@ class Odometer:
 
     def accumulate_distance(self, distance_meters: float):
         self.distanceAccumulator = self.distanceAccumulator + distance_meters
+        self.travelled = self.travelled + distance_meters
 
-    def addPosition(self, newFix: FourDPosition):
+    def addPosition(self, newFix: FourDPosition) -> Displacement:
+        """Takes a fix; returns the displacement from the last one"""
         displacement = newFix.subtract(self.lastFix)
         if self.mode == OdometerMode.DRIVE:
-            self.distanceAccumulator = self.distanceAccumulator + displacement.distance
+            self.accumulate_distance(displacement.distance)
         elif self.mode == OdometerMode.REVERSE:
-            self.distanceAccumulator = self.distanceAccumulator - displacement.distance
+            self.accumulate_distance(-displacement.distance)
         self.lastFix = newFix
+        return displacement
 
     def get_average_speed(self):
         elapsed = self.lastFix.timestamp - self.origFix.timestamp
@@ -158,43 +176,63 @@ class Instruction:
         else:
             return False
 
-    def activate(self, odometer: Odometer):
+    def activate(
+        self,
+        odometer: Odometer,
+        start_distance: Optional[float] = None,
+        start_time: Optional[datetime] = None,
+    ):
+        """Starts the instruction now, or at an earlier point between fixes"""
         self.odometer = odometer
-        self.start_distance = odometer.get_accumulated_distance()
-        self.start_time = odometer.lastFix.timestamp
+        if start_distance is None:
+            start_distance = odometer.get_accumulated_distance()
+        if start_time is None:
+            start_time = odometer.lastFix.timestamp
+        self.start_distance = start_distance
+        self.start_time = start_time
+        self.ends_by_time = False
         if self.absolute_distance is not None and self.speed is not None:
-            self.activate_distance_speed()
+            self.derive = self.activate_distance_speed
         elif self.absolute_time is not None and self.speed is not None:
-            self.activate_time_speed()
+            self.derive = self.activate_time_speed
         elif self.absolute_time is not None and self.absolute_distance is not None:
-            self.activate_time_distance()
+            self.derive = self.activate_time_distance
         else:
             raise ValueError("Not enough information to activate instruction")
+        self.derive()
+
+    def shift(self, distance: float):
+        """Moves the start by distance meters, for an odometer that jumped.
+
+        What activate() worked out from the start is worked out again; what
+        was entered stays as it was.
+        """
+        self.start_distance = self.start_distance + distance
+        self.derive()
 
     def activate_time_speed(self):
-        time_remaining = self.absolute_time - self.odometer.lastFix.timestamp
+        self.ends_by_time = True
+        time_remaining = self.absolute_time - self.start_time
         self.absolute_distance = (
-            self.odometer.get_accumulated_distance()
+            self.start_distance
             + self.speed * time_remaining.total_seconds() / 60 / 60 * 1000
         )
 
     def activate_time_distance(self):
-        time_remaining = self.absolute_time - self.odometer.lastFix.timestamp
-        self.speed = (
-            (self.absolute_distance - self.odometer.get_accumulated_distance()) / 1000
-        ) / (time_remaining.total_seconds() / 60 / 60)
+        time_remaining = self.absolute_time - self.start_time
+        self.speed = ((self.absolute_distance - self.start_distance) / 1000) / (
+            time_remaining.total_seconds() / 60 / 60
+        )
 
     def activate_distance_speed(self):
-        distance_remaining = (
-            self.absolute_distance - self.odometer.get_accumulated_distance()
-        )
+        distance_remaining = self.absolute_distance - self.start_distance
         try:
             time_to_add = timedelta(
                 seconds=(distance_remaining / 1000) / self.speed * 60 * 60
             )
         except ZeroDivisionError:
             time_to_add = timedelta(seconds=0)
-        self.absolute_time = self.odometer.lastFix.timestamp + time_to_add
+        self.absolute_time = self.start_time + time_to_add
 
     def get_time_remaining(self) -> timedelta:
         """Returns time remaining in timedelta"""
@@ -231,63 +269,525 @@ class CAST:
             return 0
 
 
+def response_to_packet(response: dict):
+    """GpsResponse.from_json, but hspeed is None if the fix carried no speed.
+
+    gpsd-py3 fills in a missing speed as 0, which would read as stopped.
+    """
+    packet = gpsd.GpsResponse.from_json(response)
+    if packet.mode >= 2 and "speed" not in response["tpv"][-1]:
+        packet.hspeed = None
+    return packet
+
+
+def tpv_to_packet(report: dict):
+    """Wraps a gpsd TPV report in the GpsResponse that get_current() returns"""
+    return response_to_packet({"active": 1, "tpv": [report], "sky": [{}]})
+
+
+class GpsdSource:
+    """Fix source backed by a gpsd daemon, via the gpsd-py3 client.
+
+    get_current() polls gpsd. After watch(), gpsd streams each fix as it
+    arrives instead; the socket (fileno()) becomes readable and receive()
+    returns the new fixes, so a caller can sleep on it with selectors.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 2947):
+        self.host = host
+        self.port = port
+        self.buffer = b""
+        self.socket = None
+        self.stream = None
+
+    def connect(self):
+        gpsd.connect(host=self.host, port=self.port)
+        # gpsd-py3 keeps one connection in module globals; keep ours
+        self.socket = gpsd.gpsd_socket
+        self.stream = gpsd.gpsd_stream
+
+    def get_current(self):
+        self.stream.write("?POLL;\n")
+        self.stream.flush()
+        response = json.loads(self.stream.readline())
+        if response["class"] != "POLL":
+            raise ValueError("Unexpected gpsd reply: " + response["class"])
+        return response_to_packet(response)
+
+    def close(self):
+        self.socket.close()
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def timeout(self):
+        """Fixes are only ever due when the socket is readable"""
+        return None
+
+    def watch(self):
+        """Asks gpsd to stream reports; get_current() must not be used after"""
+        self.socket.sendall(b'?WATCH={"enable":true,"json":true}\n')
+
+    def receive(self) -> list:
+        """Reads what gpsd has sent so far; returns the complete TPV fixes in it"""
+        data = self.socket.recv(4096)
+        if not data:
+            raise ConnectionError("gpsd closed the connection")
+        lines = (self.buffer + data).split(b"\n")
+        self.buffer = lines.pop()
+        packets = []
+        for line in lines:
+            report = json.loads(line)
+            if report["class"] == "TPV":
+                packets.append(tpv_to_packet(report))
+        return packets
+
+
+def make_source(config):
+    """The fix source for the receivers in config.yaml; gpsd on localhost if none"""
+    receivers = config.get_receivers()
+    if not receivers:
+        return GpsdSource()
+    sources = {}
+    for receiver in receivers:
+        host, _, port = receiver.rpartition(":")
+        sources[receiver] = GpsdSource(host, int(port))
+    if len(sources) == 1:
+        return sources[receivers[0]]
+    return FusionSource(sources, config.get_receiver_wait())
+
+
+class Checkpoint:
+    """What a command may change, saved just before it runs.
+
+    Only references and numbers are kept: instructions are not changed once
+    replaced, and the odometer's never-reset travelled total is enough to
+    carry distance driven since forward on undo.
+    """
+
+    def __init__(self, rcomp, command: str):
+        self.command = command
+        self.origFix = rcomp.odo.origFix
+        self.distanceAccumulator = rcomp.odo.distanceAccumulator
+        self.travelled = rcomp.odo.travelled
+        self.calibration = rcomp.odo.calibration
+        self.mode = rcomp.odo.mode
+        self.current_instruction = rcomp.current_instruction
+        self.cast = rcomp.cast
+        self.queued = rcomp.queued
+        self.leg = rcomp.leg
+        self.instruction_seq = rcomp.instruction_seq
+        self.advance_seq = rcomp.advance_seq
+        self.zeroes = command == "zero" or (
+            command == "start" and rcomp.current_instruction.dummy
+        )
+        # What the command left, so undo only reverts what nothing else changed
+        self.mode_after = None
+        self.seq_after = None
+
+
+class RallyState:
+    """A snapshot of what the display shows, detached from the live objects"""
+
+    def __init__(
+        self,
+        fix_time: datetime,
+        fix_count: int,
+        odometer: float,
+        mode: OdometerMode,
+        speed: float,
+        calibration: float,
+        pace: float,
+        cast: float,
+        time_remaining: timedelta,
+        distance_remaining: float,
+        current_time: Optional[datetime],
+        instruction_seq: int,
+        advance_seq: int,
+        message: str,
+        message_seq: int,
+    ):
+        self.fix_time = fix_time
+        self.fix_count = fix_count
+        self.odometer = odometer  # meters
+        self.mode = mode
+        self.speed = speed  # kilometers per hour
+        self.calibration = calibration
+        self.pace = pace  # seconds
+        self.cast = cast  # kilometers per hour
+        self.time_remaining = time_remaining
+        self.distance_remaining = distance_remaining  # meters
+        self.current_time = current_time
+        self.instruction_seq = instruction_seq
+        self.advance_seq = advance_seq  # queued instructions started so far
+        self.message = message
+        self.message_seq = message_seq
+
+
 class RallyComputer:
-    def __init__(self):
+    def __init__(self, source=None):
         self.config = Config("config.yaml")
-        gpsd.connect()
-        packet = gpsd.get_current()
+        if source is None:
+            source = make_source(self.config)
+        self.source = source
+        self.source.connect()
+        packet = self.source.get_current()
         while packet.mode < 2:
             time.sleep(1)
-            packet = gpsd.get_current()
+            packet = self.source.get_current()
         packet_time = packet.get_time().replace(tzinfo=timezone.utc)
         self.odo = Odometer(
             FourDPosition((packet.lat, packet.lon), packet.alt, packet_time),
             calibration=self.config.get_odometer_calibration(),
         )
+        self.last_packet_time = packet_time  # accepted by the filters or not
         self.current_instruction = Instruction()
         self.cast = CAST(self.current_instruction, self.odo)
+        self.filters = build_pipeline(self.config.get_filters())
+        self.filters.process(self.odo.origFix)
+        self.fix_count = 0
+        self.queued = None
+        self.advance_log = self.config.get_advance_log()
+        self.leg = None
+        self.leg_log = self.config.get_leg_log()
+        self.finished = collections.deque()  # (leg, report) not yet written
+        self.checkpoints = collections.deque(maxlen=self.config.get_undo_depth())
+        self.fix_log = None
+        if self.config.get_fix_log():
+            self.fix_log = FixLogWriter(self.config.get_fix_log())
+            self.fix_log.fix(self.odo.origFix)
+            self.fix_log.mark("zero")
+        self.instruction_seq = 0
+        self.advance_seq = 0
+        self.message = ""
+        self.message_seq = 0
 
     def update(self):
         packet = self.block_until_new_fix()
-        speed_mps = packet.hspeed
-        speed_kph = speed_mps * 3.6
-        packet_time = packet.get_time().replace(tzinfo=timezone.utc)
-        self.odo.addPosition(
-            FourDPosition((packet.lat, packet.lon), packet.alt, packet_time, speed_kph)
-        )
+        self.add_packet(packet)
 
     def try_update(self):
         packet, new_fix = self.try_new_fix()
         if new_fix:
-            speed_mps = packet.hspeed
-            speed_kph = speed_mps * 3.6
-            packet_time = packet.get_time().replace(tzinfo=timezone.utc)
-            self.odo.addPosition(
-                FourDPosition(
-                    (packet.lat, packet.lon), packet.alt, packet_time, speed_kph
+            self.add_packet(packet)
+
+    def receive_update(self) -> bool:
+        """Consumes fixes streamed by the source; returns True if any were new"""
+        new_fix = False
+        no_fix = False
+        for packet in self.source.receive():
+            no_fix = packet.mode < 2
+            if not no_fix and self.is_new_fix(packet):
+                self.add_packet(packet)
+                new_fix = True
+        if no_fix:
+            raise gpsd.NoFixError("Needs at least 2D fix")
+        return new_fix
+
+    def add_packet(self, packet):
+        speed_known = packet.hspeed is not None
+        speed_kph = packet.hspeed * 3.6 if speed_known else 0
+        packet_time = packet.get_time().replace(tzinfo=timezone.utc)
+        self.last_packet_time = packet_time
+        error = max(packet.error.get("x", 0), packet.error.get("y", 0))
+        fix = self.filters.process(
+            FourDPosition(
+                (packet.lat, packet.lon),
+                packet.alt,
+                packet_time,
+                speed_kph,
+                mode=packet.mode,
+                error=error,
+                speed_known=speed_known,
+            )
+        )
+        if fix is None:
+            return
+        before_distance = self.odo.get_accumulated_distance()
+        before_time = self.odo.lastFix.timestamp
+        moved = self.odo.addPosition(fix).distance * self.odo.calibration
+        self.fix_count += 1
+        if self.fix_log is not None:
+            self.fix_log.fix(fix)
+        if self.finished:
+            # Legs an undo could resume go on as if they had not ended
+            for checkpoint in self.resumable():
+                checkpoint.leg.add(
+                    checkpoint.cast.get_offset(), fix.timestamp, moved, self.odo.mode
                 )
+        if self.queued is not None and not self.current_instruction.dummy:
+            if self.check_advance(before_distance, before_time, moved):
+                return
+        if self.leg is not None:
+            self.leg.add(self.cast.get_offset(), fix.timestamp, moved, self.odo.mode)
+
+    def check_advance(
+        self, before_distance: float, before_time: datetime, moved: float
+    ) -> bool:
+        """Starts the queued instruction if the current one ended by this fix.
+
+        Instructions end at their distance, or at their time if they were
+        given a time and CAST (a PAUSE). The end is placed between the last
+        two fixes by linear interpolation, and the distance moved since the
+        last fix is split between the two legs there. Returns True if it
+        started the queued instruction.
+        """
+        current = self.current_instruction
+        distance = self.odo.get_accumulated_distance()
+        fix_time = self.odo.lastFix.timestamp
+        if current.ends_by_time:
+            if fix_time < current.absolute_time:
+                return False
+            if fix_time == before_time:
+                fraction = 1.0
+            else:
+                fraction = (current.absolute_time - before_time) / (
+                    fix_time - before_time
+                )
+        else:
+            if distance < current.absolute_distance:
+                return False
+            if distance == before_distance:
+                fraction = 1.0
+            else:
+                fraction = (current.absolute_distance - before_distance) / (
+                    distance - before_distance
+                )
+        fraction = min(max(fraction, 0.0), 1.0)
+        start_distance = before_distance + fraction * (distance - before_distance)
+        start_time = before_time + fraction * (fix_time - before_time)
+        if self.leg is not None:
+            self.leg.add(
+                self.cast.get_offset(), fix_time, moved * fraction, self.odo.mode
+            )
+        instruction = self.queued
+        self.queued = None
+        self.advance_seq += 1
+        self.start_instruction(instruction, start_distance, start_time)
+        if self.leg is not None:
+            self.leg.add_distance(moved * (1 - fraction), self.odo.mode)
+        self.log_advance(start_distance, start_time)
+        return True
+
+    def log_advance(self, distance: float, at: datetime):
+        """Reports an automatic advance and appends it to the advance log"""
+        local = at.astimezone(self.config.get_timezone())
+        self.report(
+            "Next at {:.3f} {} {}".format(
+                self.config.to_display_units(distance / 1000),
+                self.config.get_unit_name(),
+                local.strftime("%H:%M:%S.%f")[:-5],
             )
+        )
+        if self.advance_log:
+            record = {
+                "instruction": self.instruction_seq,
+                "time": at.isoformat(),
+                "distance_m": distance,
+                "cast_kmh": self.cast.average,
+            }
+            with open(self.advance_log, "a") as log:
+                log.write(json.dumps(record) + "\n")
+
+    def is_new_fix(self, packet) -> bool:
+        packet_time = packet.get_time().replace(tzinfo=timezone.utc)
+        return packet_time != self.last_packet_time
 
     def try_new_fix(self):
-        packet = gpsd.get_current()
-        if packet.get_time() != self.odo.lastFix.timestamp:
-            return packet, True
-        else:
-            return packet, False
+        packet = self.source.get_current()
+        return packet, self.is_new_fix(packet)
 
     def block_until_new_fix(self):
-        packet = gpsd.get_current()
-        while packet.get_time() == self.odo.lastFix.timestamp:
+        packet = self.source.get_current()
+        while not self.is_new_fix(packet):
             time.sleep(0.05)
-            packet = gpsd.get_current()
+            packet = self.source.get_current()
         return packet
 
-    def start_instruction(self, instruction: Instruction):
+    def start_instruction(
+        self,
+        instruction: Instruction,
+        start_distance: Optional[float] = None,
+        start_time: Optional[datetime] = None,
+    ):
+        instruction.activate(self.odo, start_distance, start_time)
+        self.finish_leg(instruction.start_time)
         self.current_instruction = instruction
-        instruction.activate(self.odo)
         self.cast = CAST(instruction, self.odo)
+        self.instruction_seq += 1
+        if not instruction.dummy:
+            self.leg = LegStats(self.instruction_seq, instruction)
         if self.odo.mode == OdometerMode.PARK:
-            self.odo.mode = OdometerMode.DRIVE
+            self.set_mode(OdometerMode.DRIVE)
+
+    def finish_leg(self, end_time: Optional[datetime] = None):
+        """Ends the current instruction's leg and writes the leg reports due"""
+        if self.leg is None:
+            return
+        self.finished.append((self.leg, self.leg.report(end_time)))
+        self.leg = None
+        self.write_legs()
+
+    def resumable(self) -> list:
+        """Checkpoints of starts whose undo would resume the leg they ended"""
+        return [
+            checkpoint
+            for checkpoint in self.checkpoints
+            if checkpoint.command == "start"
+            and checkpoint.leg is not None
+            and checkpoint.advance_seq == self.advance_seq
+        ]
+
+    def write_legs(self):
+        """Appends finished leg reports to the leg log, in order.
+
+        Reports stop at the first leg an undo could still resume, so an
+        instruction is only reported once it has really ended.
+        """
+        held = [checkpoint.leg for checkpoint in self.resumable()]
+        while self.finished and self.finished[0][0] not in held:
+            _, report = self.finished.popleft()
+            if self.leg_log:
+                with open(self.leg_log, "a") as log:
+                    log.write(json.dumps(report) + "\n")
+
+    def close(self):
+        """Reports the last legs, and closes the fix log and the source"""
+        self.finish_leg()
+        self.checkpoints.clear()
+        self.write_legs()
+        if self.fix_log is not None:
+            self.fix_log.close()
+            self.fix_log = None
+        self.source.close()
+
+    def start_idle(self):
+        """Starts the placeholder instruction shown before the first real one"""
+        self.start_instruction(Instruction(distance_km=0, speed_kmh=0, dummy=True))
+        self.set_mode(OdometerMode.PARK)
+
+    def set_mode(self, mode: OdometerMode):
+        self.odo.mode = mode
+        if self.fix_log is not None:
+            self.fix_log.mark("mode", mode=mode.name)
+
+    def zero(self):
+        self.odo.reset()
+        if self.fix_log is not None:
+            self.fix_log.mark("zero")
+
+    def handle_command(self, command: tuple):
+        """Applies a command from the display.
+
+        Commands are ("start", instruction), ("queue", instruction,
+        advance_seq), ("mode", odometer_mode), ("zero",), ("calibrate",
+        expected_distance) and ("undo",). A queued instruction starts by itself
+        when the current one ends; a queue sent before the display saw the
+        last one start is refused. start, zero and calibrate can be undone.
+        """
+        name = command[0]
+        if name in ("start", "zero", "calibrate"):
+            checkpoint = Checkpoint(self, name)
+            self.checkpoints.append(checkpoint)
+            self.write_legs()  # the oldest checkpoint may have dropped out
+            try:
+                self.run_command(command)
+            finally:
+                checkpoint.mode_after = self.odo.mode
+                checkpoint.seq_after = self.instruction_seq
+        elif name == "undo":
+            self.undo()
+        else:
+            self.run_command(command)
+
+    def run_command(self, command: tuple):
+        name = command[0]
+        if name == "start":
+            self.queued = None
+            if self.current_instruction.dummy:
+                self.zero()
+            self.start_instruction(command[1])
+        elif name == "queue":
+            if command[2] != self.advance_seq:
+                self.report("Next instruction already started")
+                return
+            # A copy, so later edits on the display side have to be queued again
+            self.queued = copy.copy(command[1])
+        elif name == "mode":
+            self.set_mode(command[1])
+        elif name == "zero":
+            self.zero()
+        elif name == "calibrate":
+            if self.fix_log is not None:
+                self.fix_log.mark("calibrate", expected_m=command[1] * 1000)
+            self.odo.calibrate(command[1])
+            self.config.set_calibration(self.odo.calibration)
+            self.report("Cal: {}".format(self.odo.calibration))
+        else:
+            raise ValueError("Unknown command: " + name)
+
+    def undo(self):
+        """Restores the last checkpoint, keeping the distance driven since"""
+        if not self.checkpoints:
+            self.report("Nothing to undo")
+            return
+        checkpoint = self.checkpoints.pop()
+        before = self.odo.get_accumulated_distance()
+        since = self.odo.travelled - checkpoint.travelled
+        self.odo.distanceAccumulator = checkpoint.distanceAccumulator + since
+        self.odo.origFix = checkpoint.origFix
+        if self.odo.calibration != checkpoint.calibration:
+            self.odo.calibration = checkpoint.calibration
+            self.config.set_calibration(checkpoint.calibration)
+        if self.odo.mode == checkpoint.mode_after:
+            self.set_mode(checkpoint.mode)
+        if (
+            checkpoint.command == "start"
+            and self.instruction_seq == checkpoint.seq_after
+        ):
+            self.current_instruction = checkpoint.current_instruction
+            self.cast = checkpoint.cast
+            self.queued = checkpoint.queued
+            self.leg = checkpoint.leg
+            self.finished = collections.deque(
+                entry for entry in self.finished if entry[0] is not self.leg
+            )
+            self.instruction_seq = checkpoint.instruction_seq
+        elif self.instruction_seq != checkpoint.seq_after:
+            # An instruction started by itself since, measured on the odometer
+            # being undone; keep it, moved to where the odometer now reads
+            self.current_instruction.shift(self.odo.get_accumulated_distance() - before)
+        self.write_legs()
+        if self.fix_log is not None:
+            if checkpoint.zeroes:
+                self.fix_log.mark("unzero")
+            if checkpoint.command == "calibrate":
+                self.fix_log.mark("uncalibrate")
+        self.report("Undid " + checkpoint.command)
+
+    def report(self, message: str):
+        """Sets the message for the display's error window"""
+        self.message = message
+        self.message_seq += 1
+
+    def get_state(self) -> RallyState:
+        return RallyState(
+            fix_time=self.odo.lastFix.timestamp,
+            fix_count=self.fix_count,
+            odometer=self.odo.get_accumulated_distance(),
+            mode=self.odo.mode,
+            speed=self.odo.get_last_speed(),
+            calibration=self.odo.calibration,
+            pace=self.cast.get_offset(),
+            cast=self.cast.average,
+            time_remaining=self.current_instruction.get_time_remaining(),
+            distance_remaining=self.current_instruction.get_distance_remaining(),
+            current_time=self.current_instruction.absolute_time,
+            instruction_seq=self.instruction_seq,
+            advance_seq=self.advance_seq,
+            message=self.message,
+            message_seq=self.message_seq,
+        )
 
 
 class Config:
@@ -315,6 +815,78 @@ class Config:
         else:
             return self.conf.get("odometer_calibration", 1)
 
+    def get_filters(self):
+        if not self.conf:
+            return {}
+        else:
+            return self.conf.get("filters", {})
+
+    def get_route_book(self):
+        if not self.conf:
+            return None
+        else:
+            return self.conf.get("route_book")
+
+    def get_pace_table_cache(self):
+        if not self.conf:
+            return ".pace_tables"
+        else:
+            return self.conf.get("pace_table_cache", ".pace_tables")
+
+    def get_split_processes(self):
+        if not self.conf:
+            return False
+        else:
+            return self.conf.get("split_processes", False)
+
+    def get_max_fps(self):
+        if not self.conf:
+            return 10
+        else:
+            return self.conf.get("max_fps", 10)
+
+    def get_auto_advance(self):
+        if not self.conf:
+            return False
+        else:
+            return self.conf.get("auto_advance", False)
+
+    def get_advance_log(self):
+        if not self.conf:
+            return "advances.log"
+        else:
+            return self.conf.get("advance_log", "advances.log")
+
+    def get_receivers(self):
+        if not self.conf:
+            return []
+        else:
+            return self.conf.get("receivers", [])
+
+    def get_receiver_wait(self):
+        if not self.conf:
+            return 0.25
+        else:
+            return self.conf.get("receiver_wait", 0.25)
+
+    def get_leg_log(self):
+        if not self.conf:
+            return "legs.log"
+        else:
+            return self.conf.get("leg_log", "legs.log")
+
+    def get_undo_depth(self):
+        if not self.conf:
+            return 10
+        else:
+            return self.conf.get("undo_depth", 10)
+
+    def get_fix_log(self):
+        if not self.conf:
+            return None
+        else:
+            return self.conf.get("fix_log")
+
     def set_calibration(self, calibration):
         if not self.conf:
             self.conf = {}
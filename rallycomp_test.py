@@ -1,6 +1,47 @@
+import os
+import tempfile
 import unittest
-from rallycomp import CAST, FourDPosition, Instruction, Odometer, RallyComputer
-from datetime import datetime
+import gpsd
+from legstats import load_reports
+from rallycomp import (
+    CAST,
+    FourDPosition,
+    Instruction,
+    Odometer,
+    OdometerMode,
+    RallyComputer,
+    tpv_to_packet,
+)
+from datetime import datetime, timedelta
+
+
+def make_packet(lat, lon, time, mode=3, speed=None):
+    packet = gpsd.GpsResponse()
+    packet.mode = mode
+    packet.lat = lat
+    packet.lon = lon
+    packet.alt = 150
+    packet.hspeed = speed
+    packet.time = time
+    return packet
+
+
+class ListSource:
+    def __init__(self, first, batches):
+        self.first = first
+        self.batches = batches
+
+    def connect(self):
+        pass
+
+    def get_current(self):
+        return self.first
+
+    def receive(self):
+        return self.batches.pop(0)
+
+    def close(self):
+        pass
 
 
 class TestFourDPosition(unittest.TestCase):
@@ -159,3 +200,261 @@ class TestPace(unittest.TestCase):
         )
         pace = cast.get_offset()
         self.assertEqual(pace, 0)
+
+
+class TestRallyComputer(unittest.TestCase):
+    def test_receive_update_skips_repeated_fix(self):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        second = make_packet(47.0001, -122.0, "2020-01-01T00:00:01.000Z")
+        rcomp = RallyComputer(ListSource(first, [[first], [second], [second]]))
+        rcomp.odo.mode = OdometerMode.DRIVE
+        self.assertFalse(rcomp.receive_update())
+        self.assertTrue(rcomp.receive_update())
+        self.assertFalse(rcomp.receive_update())
+        self.assertEqual(rcomp.odo.distanceAccumulator, 11.119492664825001)
+
+    def test_fix_without_speed_is_not_taken_as_stopped(self):
+        packet = tpv_to_packet(
+            {
+                "class": "TPV",
+                "mode": 3,
+                "time": "2020-01-01T00:00:01.000Z",
+                "lat": 47.0001,
+                "lon": -122.0,
+                "alt": 150,
+            }
+        )
+        self.assertIsNone(packet.hspeed)
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z", speed=0)
+        rcomp = RallyComputer(ListSource(first, [[packet]]))
+        rcomp.odo.mode = OdometerMode.DRIVE
+        rcomp.receive_update()
+        self.assertAlmostEqual(rcomp.odo.distanceAccumulator, 11.1195, 4)
+
+    def test_receive_update_without_fix(self):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        lost = make_packet(0, 0, "", mode=1)
+        rcomp = RallyComputer(ListSource(first, [[lost]]))
+        with self.assertRaises(gpsd.NoFixError):
+            rcomp.receive_update()
+
+    def test_start_command_zeroes_after_idle(self):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        second = make_packet(47.0001, -122.0, "2020-01-01T00:00:01.000Z")
+        rcomp = RallyComputer(ListSource(first, [[second]]))
+        rcomp.start_idle()
+        rcomp.handle_command(("mode", OdometerMode.DRIVE))
+        rcomp.receive_update()
+        rcomp.handle_command(("start", Instruction(speed_kmh=50, distance_km=1)))
+        state = rcomp.get_state()
+        self.assertEqual(state.odometer, 0)
+        self.assertEqual(state.cast, 50)
+        self.assertEqual(state.instruction_seq, 2)
+        with self.assertRaises(ValueError):
+            rcomp.handle_command(("bogus",))
+
+    def test_queued_instruction_starts_at_interpolated_distance(self):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        batches = [
+            [make_packet(47.0001, -122.0, "2020-01-01T00:00:01.000Z", speed=11)],
+            [make_packet(47.0002, -122.0, "2020-01-01T00:00:02.000Z", speed=11)],
+        ]
+        rcomp = RallyComputer(ListSource(first, batches))
+        rcomp.advance_log = None
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        rcomp.leg_log = os.path.join(tmp.name, "legs.log")
+        rcomp.start_idle()
+        rcomp.handle_command(("start", Instruction(speed_kmh=36, distance_km=0.015)))
+        queued = Instruction(speed_kmh=72, distance_km=1)
+        rcomp.handle_command(("queue", queued, 0))
+        rcomp.receive_update()
+        self.assertEqual(rcomp.instruction_seq, 2)
+        rcomp.receive_update()
+        self.assertEqual(rcomp.instruction_seq, 3)
+        self.assertEqual(rcomp.cast.average, 72)
+        started = rcomp.current_instruction
+        self.assertAlmostEqual(started.start_distance, 15)
+        self.assertAlmostEqual(
+            started.start_time.timestamp() - 1577836800, 15 / 11.1194926648, 6
+        )
+        self.assertIsNone(rcomp.queued)
+        # The step across the end is split between the two legs
+        [report] = load_reports(rcomp.leg_log)
+        self.assertAlmostEqual(report["distance_m"]["DRIVE"], 15)
+        self.assertAlmostEqual(rcomp.leg.distance["DRIVE"], 22.238985 - 15, 5)
+
+    def test_queued_instruction_starts_when_pause_ends(self):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        batches = [
+            [make_packet(47.0, -122.0, "2020-01-01T00:00:02.000Z")],
+            [make_packet(47.0, -122.0, "2020-01-01T00:00:04.000Z")],
+        ]
+        rcomp = RallyComputer(ListSource(first, batches))
+        rcomp.advance_log = None
+        rcomp.leg_log = None
+        rcomp.start_idle()
+        pause_end = rcomp.odo.lastFix.timestamp + timedelta(seconds=3)
+        rcomp.handle_command(("start", Instruction(time=pause_end, speed_kmh=0)))
+        rcomp.handle_command(("queue", Instruction(speed_kmh=50, distance_km=1), 0))
+        rcomp.receive_update()
+        self.assertEqual(rcomp.instruction_seq, 2)
+        rcomp.receive_update()
+        self.assertEqual(rcomp.instruction_seq, 3)
+        self.assertEqual(rcomp.current_instruction.start_time, pause_end)
+
+    def test_queue_sent_before_an_advance_was_seen_is_refused(self):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        second = make_packet(47.0001, -122.0, "2020-01-01T00:00:01.000Z")
+        rcomp = RallyComputer(ListSource(first, [[second]]))
+        rcomp.advance_log = None
+        rcomp.leg_log = None
+        rcomp.start_idle()
+        rcomp.handle_command(("start", Instruction(speed_kmh=36, distance_km=0.005)))
+        rcomp.handle_command(("queue", Instruction(speed_kmh=72, distance_km=1), 0))
+        rcomp.receive_update()
+        self.assertEqual(rcomp.get_state().advance_seq, 1)
+        stale = Instruction(speed_kmh=72, distance_km=2)
+        rcomp.handle_command(("queue", stale, 0))
+        self.assertIsNone(rcomp.queued)
+        self.assertEqual(rcomp.message, "Next instruction already started")
+
+    def test_leg_report_when_next_instruction_starts(self):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        second = make_packet(47.0001, -122.0, "2020-01-01T00:00:01.000Z", speed=11)
+        rcomp = RallyComputer(ListSource(first, [[second]]))
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        rcomp.leg_log = os.path.join(tmp.name, "legs.log")
+        rcomp.start_idle()
+        rcomp.handle_command(("start", Instruction(speed_kmh=36, distance_km=1)))
+        rcomp.receive_update()
+        rcomp.handle_command(("start", Instruction(speed_kmh=50, distance_km=2)))
+        # Not written while the start can still be undone
+        self.assertFalse(os.path.exists(rcomp.leg_log))
+        rcomp.close()
+        first_report, _ = load_reports(rcomp.leg_log)
+        self.assertEqual(first_report["instruction"], 2)
+        self.assertEqual(first_report["fixes"], 1)
+        self.assertAlmostEqual(first_report["distance_m"]["DRIVE"], 11.119492664825001)
+
+    def test_undone_start_is_reported_once(self):
+        rcomp = self.drive(3)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        rcomp.leg_log = os.path.join(tmp.name, "legs.log")
+        rcomp.start_idle()
+        rcomp.handle_command(("start", Instruction(speed_kmh=36, distance_km=1)))
+        rcomp.receive_update()
+        rcomp.handle_command(("start", Instruction(speed_kmh=50, distance_km=0.1)))
+        rcomp.receive_update()
+        rcomp.handle_command(("undo",))
+        rcomp.receive_update()
+        rcomp.handle_command(("start", Instruction(speed_kmh=50, distance_km=2)))
+        rcomp.close()
+        reports = load_reports(rcomp.leg_log)
+        self.assertEqual([report["instruction"] for report in reports], [2, 3])
+        # The fix taken during the mistaken start counts for the resumed leg
+        self.assertEqual(reports[0]["fixes"], 3)
+        self.assertAlmostEqual(reports[0]["distance_m"]["DRIVE"], 33.358477994475)
+
+    def drive(self, seconds):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        batches = [
+            [
+                make_packet(
+                    47.0 + second / 10000,
+                    -122.0,
+                    "2020-01-01T00:00:{:02d}.000Z".format(second),
+                    speed=11,
+                )
+            ]
+            for second in range(1, seconds + 1)
+        ]
+        rcomp = RallyComputer(ListSource(first, batches))
+        rcomp.advance_log = None
+        rcomp.leg_log = None
+        rcomp.config.set_calibration = lambda calibration: None
+        return rcomp
+
+    def test_rejected_fix_is_not_taken_again(self):
+        first = make_packet(47.0, -122.0, "2020-01-01T00:00:00.000Z")
+        rcomp = RallyComputer(ListSource(first, []))
+        # A multipath spike, far too far to have driven in a second
+        rcomp.source.first = make_packet(47.1, -122.0, "2020-01-01T00:00:01.000Z")
+        rcomp.try_update()
+        rcomp.try_update()
+        self.assertEqual(rcomp.fix_count, 0)
+        self.assertEqual(rcomp.filters.stats()[0]["seen"], 2)
+        self.assertEqual(rcomp.filters.stats()[1]["rejected"], 1)
+
+    def test_undo_zero_carries_distance_forward(self):
+        rcomp = self.drive(4)
+        rcomp.handle_command(("mode", OdometerMode.DRIVE))
+        rcomp.receive_update()
+        rcomp.receive_update()
+        before = rcomp.odo.distanceAccumulator
+        rcomp.handle_command(("zero",))
+        rcomp.receive_update()
+        since = rcomp.odo.distanceAccumulator
+        rcomp.handle_command(("undo",))
+        rcomp.receive_update()
+        self.assertAlmostEqual(
+            rcomp.odo.distanceAccumulator, before + since + 11.119492664825001
+        )
+        self.assertEqual(rcomp.message, "Undid zero")
+        rcomp.handle_command(("undo",))
+        self.assertEqual(rcomp.message, "Nothing to undo")
+
+    def test_undo_calibrate_and_start(self):
+        rcomp = self.drive(3)
+        rcomp.start_idle()
+        first = Instruction(speed_kmh=36, distance_km=1)
+        rcomp.handle_command(("start", first))
+        rcomp.receive_update()
+        rcomp.handle_command(("calibrate", 0.0222))
+        rcomp.handle_command(("start", Instruction(speed_kmh=50, distance_km=2)))
+        rcomp.receive_update()
+        rcomp.handle_command(("undo",))
+        self.assertIs(rcomp.current_instruction, first)
+        self.assertEqual(rcomp.instruction_seq, 2)
+        self.assertEqual(rcomp.get_state().cast, 36)
+        rcomp.handle_command(("undo",))
+        self.assertEqual(rcomp.odo.calibration, 1)
+        self.assertAlmostEqual(rcomp.odo.distanceAccumulator, 22.238985328859915)
+
+    def test_undo_zero_keeps_instruction_queued_since(self):
+        rcomp = self.drive(6)
+        rcomp.start_idle()
+        rcomp.handle_command(("start", Instruction(speed_kmh=36, distance_km=0.05)))
+        rcomp.receive_update()
+        rcomp.handle_command(("zero",))
+        queued = Instruction(speed_kmh=72, distance_km=1)
+        rcomp.handle_command(("queue", queued, 0))
+        rcomp.handle_command(("undo",))
+        self.assertEqual(rcomp.queued.speed, queued.speed)
+        self.assertEqual(rcomp.instruction_seq, 2)
+        for _ in range(5):
+            rcomp.receive_update()
+        self.assertEqual(rcomp.advance_seq, 1)
+        self.assertEqual(rcomp.cast.average, 72)
+
+    def test_undo_zero_moves_instruction_that_started_since(self):
+        rcomp = self.drive(5)
+        rcomp.start_idle()
+        rcomp.handle_command(("mode", OdometerMode.DRIVE))
+        pause_end = rcomp.odo.lastFix.timestamp + timedelta(seconds=3)
+        rcomp.handle_command(("start", Instruction(time=pause_end, speed_kmh=0)))
+        rcomp.handle_command(("queue", Instruction(speed_kmh=36, distance_km=1), 0))
+        rcomp.receive_update()
+        rcomp.receive_update()
+        rcomp.handle_command(("zero",))
+        rcomp.receive_update()
+        rcomp.receive_update()
+        self.assertEqual(rcomp.advance_seq, 1)
+        started = rcomp.current_instruction
+        pace = rcomp.get_state().pace
+        rcomp.handle_command(("undo",))
+        self.assertIs(rcomp.current_instruction, started)
+        self.assertAlmostEqual(rcomp.get_state().pace, pace)
+        self.assertAlmostEqual(started.start_distance, 33.358477994475, 5)
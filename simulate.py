@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+from filters import METERS_PER_DEGREE
+from rallycomp import tpv_to_packet
+
+
+def format_gps_time(timestamp: datetime) -> str:
+    """Formats a UTC time the way gpsd does in TPV reports"""
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+class SyntheticTrack:
+    """Generates gpsd TPV reports for a car driving due north.
+
+    The car drives for drive_seconds at speed_kmh, then parks for
+    stop_seconds, and repeats. Time is simulated: each call to next_report()
+    advances the clock by one fix interval.
+    """
+
+    def __init__(
+        self,
+        start: datetime,
+        rate_hz: float = 1,
+        speed_kmh: float = 50,
+        position=(47.0, -122.0),
+        alt: float = 150,
+        drive_seconds: float = 600,
+        stop_seconds: float = 60,
+    ):
+        self.time = start
+        self.interval = timedelta(seconds=1 / rate_hz)
+        self.speed = speed_kmh / 3.6  # meters per second
+        self.lat = position[0]
+        self.lon = position[1]
+        self.alt = alt
+        self.drive_seconds = drive_seconds
+        self.stop_seconds = stop_seconds
+        self.elapsed = 0.0
+        self.current = self.report(0)
+
+    def current_speed(self) -> float:
+        """Returns the speed in meters per second at the current time"""
+        cycle = self.elapsed % (self.drive_seconds + self.stop_seconds)
+        if cycle < self.drive_seconds:
+            return self.speed
+        else:
+            return 0
+
+    def report(self, speed: float) -> dict:
+        return {
+            "class": "TPV",
+            "mode": 3,
+            "time": format_gps_time(self.time),
+            "lat": self.lat,
+            "lon": self.lon,
+            "alt": self.alt,
+            "speed": speed,
+        }
+
+    def next_report(self) -> dict:
+        seconds = self.interval.total_seconds()
+        speed = self.current_speed()
+        self.lat = self.lat + speed * seconds / METERS_PER_DEGREE
+        self.time = self.time + self.interval
+        self.elapsed = self.elapsed + seconds
+        self.current = self.report(speed)
+        return self.current
+
+
+class SyntheticSource:
+    """RallyComputer fix source fed from a SyntheticTrack instead of gpsd"""
+
+    def __init__(self, track: SyntheticTrack):
+        self.track = track
+
+    def connect(self):
+        pass
+
+    def get_current(self):
+        return tpv_to_packet(self.track.current)
+
+    def watch(self):
+        pass
+
+    def timeout(self):
+        return None
+
+    def close(self):
+        pass
+
+    def receive(self) -> list:
+        return [tpv_to_packet(self.track.next_report())]
@@ -0,0 +1,261 @@
+import argparse
+import curses
+import fcntl
+import json
+import os
+import pty
+import struct
+import sys
+import termios
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from display import draw_screen
+from rallycomp import Instruction, OdometerMode, RallyComputer
+from simulate import SyntheticSource, SyntheticTrack
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def take_snapshot():
+    """Snapshots traced memory, leaving out the harness's own bookkeeping"""
+    return tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ]
+    )
+
+
+def snapshot_size(snapshot) -> int:
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+
+class WindowCounter:
+    """Wraps curses.newwin to count the windows the display keeps alive.
+
+    curses windows are not tracked by gc and can't be weakly referenced, so
+    every window is held here and dropped once nothing else refers to it.
+    """
+
+    def __init__(self):
+        self.windows = []
+        self.created = 0
+        self.newwin = curses.newwin
+        curses.newwin = self.create
+
+    def create(self, *args):
+        window = self.newwin(*args)
+        self.windows.append(window)
+        self.created += 1
+        return window
+
+    def live(self) -> int:
+        # Unreferenced windows are held by self.windows, the loop variable
+        # and getrefcount's argument
+        self.windows = [w for w in self.windows if sys.getrefcount(w) > 3]
+        return len(self.windows)
+
+    def restore(self):
+        curses.newwin = self.newwin
+
+
+class SoakResult:
+    def __init__(self):
+        self.frames = 0
+        self.samples = []
+        self.growth = []
+        self.failures = []
+
+    def to_dict(self) -> dict:
+        return {
+            "frames": self.frames,
+            "samples": self.samples,
+            "growth": self.growth,
+            "failures": self.failures,
+        }
+
+
+def run_soak(stdscr, args) -> SoakResult:
+    curses.start_color()
+    curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLUE)
+    curses.init_pair(2, curses.COLOR_WHITE, curses.COLOR_GREEN)
+    curses.init_pair(3, curses.COLOR_WHITE, curses.COLOR_YELLOW)
+    curses.init_pair(4, curses.COLOR_WHITE, curses.COLOR_RED)
+
+    track = SyntheticTrack(
+        datetime(2020, 1, 1, 8, 0, 0, tzinfo=timezone.utc),
+        rate_hz=args.rate,
+        speed_kmh=args.speed,
+    )
+    rcomp = RallyComputer(SyntheticSource(track))
+    rcomp.leg_log = None  # legs are still summarized, just not written out
+    rcomp.advance_log = None
+    rcomp.start_idle()
+    rcomp.odo.mode = OdometerMode.DRIVE
+    next_instruction = Instruction(speed_kmh=args.speed)
+
+    frames = int(args.hours * 60 * 60 * args.rate)
+    frames_per_leg = int(args.leg_minutes * 60 * args.rate)
+    frames_per_sample = int(args.sample_minutes * 60 * args.rate)
+    result = SoakResult()
+    latencies = []
+    windows = WindowCounter()
+    baseline = None
+    snapshot = None
+    tracemalloc.start()
+    try:
+        for frame in range(1, frames + 1):
+            start = time.perf_counter()
+            rcomp.receive_update()
+            if frame % frames_per_leg == 0:
+                next_instruction.set_distance(
+                    rcomp.odo.get_accumulated_distance() / 1000 + args.speed / 6
+                )
+                rcomp.start_instruction(next_instruction)
+                next_instruction = Instruction(speed_kmh=args.speed)
+            draw_screen(rcomp.get_state(), rcomp.config, next_instruction, True, "", 0)
+            latencies.append(time.perf_counter() - start)
+            live_windows = windows.live()
+
+            if frame % frames_per_sample == 0:
+                snapshot = take_snapshot()
+                if baseline is None:
+                    baseline = snapshot
+                result.samples.append(
+                    {
+                        "hours": frame / args.rate / 60 / 60,
+                        "memory_kb": snapshot_size(snapshot) / 1024,
+                        "windows": live_windows,
+                        "windows_created": windows.created,
+                        "p50_ms": percentile(latencies, 0.50) * 1000,
+                        "p95_ms": percentile(latencies, 0.95) * 1000,
+                        "p99_ms": percentile(latencies, 0.99) * 1000,
+                    }
+                )
+                latencies = []
+        result.frames = frames
+        if baseline is not None:
+            result.growth = [
+                str(stat) for stat in snapshot.compare_to(baseline, "lineno")[:5]
+            ]
+    finally:
+        windows.restore()
+        tracemalloc.stop()
+
+    check_bounds(result, args)
+    return result
+
+
+def check_bounds(result: SoakResult, args):
+    # The first sample includes warm-up allocations, so compare from the second
+    if len(result.samples) < 3:
+        result.failures.append("Not enough samples; run longer or sample more often")
+        return
+    first = result.samples[1]
+    last = result.samples[-1]
+    memory_growth = last["memory_kb"] - first["memory_kb"]
+    if memory_growth > args.max_memory_growth_kb:
+        result.failures.append(
+            "Memory grew {:.1f} KB (limit {} KB)".format(
+                memory_growth, args.max_memory_growth_kb
+            )
+        )
+    latency_limit = first["p95_ms"] * args.max_latency_growth + args.latency_slack_ms
+    if last["p95_ms"] > latency_limit:
+        result.failures.append(
+            "p95 frame latency grew from {:.3f} ms to {:.3f} ms (limit {:.3f} ms)".format(
+                first["p95_ms"], last["p95_ms"], latency_limit
+            )
+        )
+    if last["windows"] > first["windows"]:
+        result.failures.append(
+            "Live curses windows grew from {} to {}".format(
+                first["windows"], last["windows"]
+            )
+        )
+
+
+def soak_in_pty(args) -> dict:
+    """Runs the soak under curses on a pseudo-terminal, leaving ours alone"""
+    read_fd, write_fd = os.pipe()
+    pid, master = pty.fork()
+    if pid == 0:
+        os.close(read_fd)
+        report = SoakResult()
+        try:
+            os.environ.setdefault("TERM", "xterm")
+            fcntl.ioctl(
+                pty.STDOUT_FILENO,
+                termios.TIOCSWINSZ,
+                struct.pack("HHHH", args.rows, args.cols, 0, 0),
+            )
+            report = curses.wrapper(run_soak, args)
+        except Exception as err:
+            report.failures.append(repr(err))
+        finally:
+            with os.fdopen(write_fd, "w") as out:
+                json.dump(report.to_dict(), out)
+            os._exit(0)
+
+    os.close(write_fd)
+    # Drain the terminal output so the child never blocks on a full pty
+    while True:
+        try:
+            if not os.read(master, 65536):
+                break
+        except OSError:
+            break
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as report:
+        return json.load(report)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Drive RallyComputer and the display through a simulated rally day"
+    )
+    parser.add_argument("--hours", type=float, default=12)
+    parser.add_argument("--rate", type=float, default=1, help="fixes per second")
+    parser.add_argument("--speed", type=float, default=50, help="CAST in km/h")
+    parser.add_argument("--leg-minutes", type=float, default=10)
+    parser.add_argument("--sample-minutes", type=float, default=30)
+    parser.add_argument("--max-memory-growth-kb", type=float, default=256)
+    parser.add_argument("--max-latency-growth", type=float, default=1.5)
+    parser.add_argument("--latency-slack-ms", type=float, default=0.5)
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--cols", type=int, default=100)
+    args = parser.parse_args(argv)
+    if min(args.leg_minutes, args.sample_minutes) * 60 * args.rate < 1:
+        parser.error("legs and samples must each be at least one fix long")
+
+    report = soak_in_pty(args)
+    print("hours   memory KB  windows  p50 ms  p95 ms  p99 ms")
+    for sample in report["samples"]:
+        print(
+            "{:5.2f}  {:10.1f}  {:7d}  {:6.3f}  {:6.3f}  {:6.3f}".format(
+                sample["hours"],
+                sample["memory_kb"],
+                sample["windows"],
+                sample["p50_ms"],
+                sample["p95_ms"],
+                sample["p99_ms"],
+            )
+        )
+    for failure in report["failures"]:
+        print("FAIL: " + failure)
+    if report["failures"]:
+        print("Largest allocation growth since the first sample:")
+        for stat in report["growth"]:
+            print("  " + stat)
+        return 1
+    print("OK: {} frames".format(report["frames"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,29 @@
+import unittest
+from datetime import datetime, timezone
+from soak import main
+from simulate import SyntheticTrack
+
+
+class TestSyntheticTrack(unittest.TestCase):
+    def test_track_drives_then_stops(self):
+        track = SyntheticTrack(
+            datetime(2020, 1, 1, 0, 0, 0, tzinfo=timezone.utc),
+            speed_kmh=36,
+            drive_seconds=2,
+            stop_seconds=1,
+        )
+        reports = [track.next_report() for _ in range(4)]
+        self.assertEqual([r["speed"] for r in reports], [10, 10, 0, 10])
+        self.assertEqual(reports[-1]["time"], "2020-01-01T00:00:04.000Z")
+
+
+class TestSoak(unittest.TestCase):
+    def test_short_soak_stays_within_bounds(self):
+        self.assertEqual(main(["--hours", "0.25", "--sample-minutes", "5"]), 0)
+
+    def test_too_short_to_sample_reports_it(self):
+        self.assertEqual(main(["--hours", "0.01", "--sample-minutes", "5"]), 1)
+
+    def test_legs_shorter_than_a_fix_are_refused(self):
+        with self.assertRaises(SystemExit):
+            main(["--hours", "0.01", "--leg-minutes", "0.001"])